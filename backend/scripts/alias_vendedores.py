@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+"""
+Alias persistidos de vendedores: texto de vendedor normalizado (normalizar) -> id_personal.
+- Cada texto distinto se decide una sola vez y queda en VendedoresAlias; en las corridas
+  siguientes es un lookup en memoria (cargar_alias trae toda la tabla en un dict).
+- Orden de decisión para los textos nuevos:
+    exacto:    clave tal cual o dada vuelta contra el mapa de PersonalDux (resolver_vendedor)
+    tokens:    mismo conjunto de palabras que un único vendedor (o subconjunto de uno solo)
+    trigramas: similitud de trigramas (Jaccard, por palabra como pg_trgm) >= UMBRAL_TRIGRAMAS
+               y con MARGEN_TRIGRAMAS sobre el segundo mejor vendedor
+  Lo que no matchea se guarda como sin_match junto con la firma de PersonalDux de ese momento:
+  solo se reintenta cuando PersonalDux cambió. Un alias que apunta a un vendedor dado de baja
+  también se vuelve a decidir.
+- Para corregir una decisión a mano: UPDATE VendedoresAlias SET id_personal=..., metodo='manual'.
+- leer_personal: el mapa de claves de nombre de PersonalDux (mapa_personal) y los vendedores
+  para el matching difuso (IndicePersonal), cacheados en disco (CACHE_DIR) y reconstruidos
+  solo cuando cambia firma_personal: con PersonalDux sin cambios no se lee la tabla.
+"""
+
+import hashlib
+import json
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from dialectos_db import get_dialect
+from normalizacion import normalizar, normalizar_series, resolver_vendedor
+
+ALIAS_TABLE = "VendedoresAlias"
+CACHE_DIR = Path(__file__).resolve().parent / "cache"
+UMBRAL_TRIGRAMAS = 0.6
+MARGEN_TRIGRAMAS = 0.1
+
+CREATE_ALIAS_SQL = f"""
+CREATE TABLE IF NOT EXISTS {ALIAS_TABLE} (
+  alias VARCHAR(255) NOT NULL PRIMARY KEY,
+  id_personal INT NULL,
+  metodo VARCHAR(20) NOT NULL,
+  score DECIMAL(5,4) NULL,
+  firmaPersonal VARCHAR(64) NULL,
+  createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+def _schema_alias(conn):
+    for stmt in get_dialect(conn).ddl(CREATE_ALIAS_SQL):
+        conn.execute(text(stmt))
+
+# Pasos de DDL compartidos por los scripts que resuelven vendedores (ver schema_versiones.py)
+ALIAS_SCHEMA_STEPS = [
+    ("vendedores/001_alias", _schema_alias),
+]
+
+def firma_personal(engine) -> str:
+    """Huella de PersonalDux (vendedores activos y última modificación): si no cambió, el mapa
+       cacheado y las decisiones sin_match siguen valiendo."""
+    with engine.connect() as conn:
+        cantidad, ultima = conn.execute(
+            text("SELECT COUNT(*), MAX(updatedAt) FROM PersonalDux WHERE deletedAt IS NULL")
+        ).fetchone()
+    return f"{cantidad}|{ultima}"
+
+def construir_mapa(dfp: pd.DataFrame) -> dict:
+    """{clave: id_personal} con las claves de armar_claves_nombre de cada fila de dfp
+       (id_personal, nombre, apellido_razon_social), en operaciones vectorizadas. Si dos
+       vendedores comparten clave, gana el primero (como el setdefault fila a fila)."""
+    ape = normalizar_series(dfp["apellido_razon_social"]).to_numpy(dtype=object)
+    nom = normalizar_series(dfp["nombre"]).to_numpy(dtype=object)
+    ids = dfp["id_personal"].to_numpy()
+    ambos = (ape != "") & (nom != "")
+    sueltas = np.where(ape != "", ape, nom)
+    coma = np.where(ambos, ape + ", " + nom, sueltas)   # 'APELLIDO, NOMBRE' o la única parte
+    espacio = np.where(ambos, ape + " " + nom, "")      # 'APELLIDO NOMBRE'
+    pos = np.arange(len(dfp))
+    claves = pd.DataFrame({
+        "pos": np.concatenate([pos, pos]),
+        "clave": np.concatenate([coma, espacio]),
+        "id": np.concatenate([ids, ids]),
+    })
+    claves = (claves[claves["clave"] != ""].sort_values("pos", kind="stable")
+              .drop_duplicates(subset=["clave"], keep="first"))
+    return dict(zip(claves["clave"].tolist(), claves["id"].astype("int64").tolist()))
+
+def _cache_path(engine) -> Path:
+    # un archivo por base: no mezclar el PersonalDux de producción con el de una copia local
+    url = engine.url.render_as_string(hide_password=True)
+    return CACHE_DIR / f"mapa_personal_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}.json"
+
+# Última lectura por archivo de cache: mapa_personal y IndicePersonal.desde_cache de una
+# misma corrida comparten una sola lectura (de disco o de PersonalDux)
+_LECTURAS = {}
+
+def leer_personal(engine, firma: str) -> dict:
+    """{'mapa': {clave: id_personal}, 'personas': [(id_personal, nombre, apellido_razon_social)]}
+       de los vendedores activos. Sale del cache en disco si la firma de PersonalDux no cambió;
+       si cambió (o no hay cache), se reconstruye con una lectura de PersonalDux y se vuelve
+       a guardar."""
+    path = _cache_path(engine)
+    memo = _LECTURAS.get(path)
+    if memo and memo[0] == firma:
+        return memo[1]
+    try:
+        cache = json.loads(path.read_text(encoding="utf-8"))
+        if isinstance(cache, dict) and cache.get("firma") == firma:
+            datos = {"mapa": {k: int(v) for k, v in cache["mapa"].items()},
+                     "personas": [(int(i), nom, ape) for i, nom, ape in cache["personas"]]}
+            _LECTURAS[path] = (firma, datos)
+            return datos
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass  # sin cache, ilegible o con otra forma: se reconstruye
+
+    dfp = pd.read_sql("SELECT id_personal, nombre, apellido_razon_social FROM PersonalDux "
+                      "WHERE deletedAt IS NULL", engine)
+    personas = dfp[["id_personal", "nombre", "apellido_razon_social"]].astype(object)
+    personas = personas.where(personas.notna(), None)
+    datos = {"mapa": construir_mapa(dfp),
+             "personas": [(int(i), nom, ape) for i, nom, ape in personas.itertuples(index=False, name=None)]}
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"firma": firma, **datos}, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar el cache de PersonalDux ({e}); se reconstruye en cada corrida")
+    _LECTURAS[path] = (firma, datos)
+    return datos
+
+def mapa_personal(engine, firma: str = None) -> dict:
+    """{'APELLIDO, NOMBRE': id_personal, ...} de los vendedores activos, del cache de
+       leer_personal. 'firma' (de firma_personal) se consulta si no se pasa; pasarla permite
+       usar la misma en resolver_vendedores."""
+    if firma is None:
+        firma = firma_personal(engine)
+    return leer_personal(engine, firma)["mapa"]
+
+def cargar_alias(engine, ids_activos, firma: str) -> dict:
+    """{alias: id_personal o None} con una sola consulta. Quedan afuera (para re-decidir) los
+       alias a vendedores que ya no están activos y los sin_match de otra firma de PersonalDux."""
+    alias = {}
+    with engine.connect() as conn:
+        filas = conn.execute(text(f"SELECT alias, id_personal, firmaPersonal FROM {ALIAS_TABLE}"))
+        for clave, id_personal, firma_alias in filas:
+            if id_personal is None:
+                if firma_alias == firma:
+                    alias[clave] = None
+            elif int(id_personal) in ids_activos:
+                alias[clave] = int(id_personal)
+    return alias
+
+def guardar_alias(engine, decisiones: dict, firma: str):
+    """Upsert de {alias: (id_personal, metodo, score)} en VendedoresAlias, en un executemany."""
+    if not decisiones:
+        return
+    dialect = get_dialect(engine)
+    sql = (f"INSERT INTO {ALIAS_TABLE} (alias, id_personal, metodo, score, firmaPersonal) "
+           f"VALUES (:alias, :id_personal, :metodo, :score, :firma) "
+           f"{dialect.upsert_clause(['id_personal', 'metodo', 'score', 'firmaPersonal'])}")
+    params = [{"alias": a, "id_personal": i, "metodo": m, "score": s, "firma": firma}
+              for a, (i, m, s) in decisiones.items()]
+    with engine.begin() as conn:
+        conn.execute(text(sql), params)
+
+def _palabras(clave: str) -> frozenset:
+    return frozenset(clave.replace(",", " ").split())
+
+def _trigramas(clave: str) -> frozenset:
+    """Trigramas por palabra con relleno ('  x ', como pg_trgm): no dependen del orden de las palabras."""
+    tri = set()
+    for palabra in _palabras(clave):
+        p = f"  {palabra} "
+        tri.update(p[i:i + 3] for i in range(len(p) - 2))
+    return frozenset(tri)
+
+class IndicePersonal:
+    """Índices de PersonalDux para el matching difuso: conjunto de palabras por vendedor e
+       índice invertido trigrama -> vendedores."""
+
+    def __init__(self, personas):
+        # personas: [(id_personal, nombre, apellido_razon_social)]
+        self.ids = []
+        self.palabras = []
+        self.trigramas = []
+        self.por_trigrama = {}
+        for id_personal, nombre, apellido in personas:
+            clave = f"{normalizar(apellido)} {normalizar(nombre)}".strip()
+            if not clave:
+                continue
+            i = len(self.ids)
+            self.ids.append(int(id_personal))
+            self.palabras.append(_palabras(clave))
+            tri = _trigramas(clave)
+            self.trigramas.append(tri)
+            for t in tri:
+                self.por_trigrama.setdefault(t, []).append(i)
+
+    @classmethod
+    def desde_cache(cls, engine, firma: str):
+        """Con los vendedores de leer_personal: la misma lectura que el mapa de la corrida."""
+        return cls(leer_personal(engine, firma)["personas"])
+
+    def por_palabras(self, clave: str):
+        """(id_personal, score) si las palabras de 'clave' son las de un único vendedor o, con al
+           menos dos palabras, un subconjunto de las de uno solo; si no, None."""
+        palabras = _palabras(clave)
+        if not palabras:
+            return None
+        iguales = {self.ids[i] for i, p in enumerate(self.palabras) if p == palabras}
+        if len(iguales) == 1:
+            return iguales.pop(), 1.0
+        if iguales or len(palabras) < 2:
+            return None
+        contienen = {(self.ids[i], len(palabras) / len(p)) for i, p in enumerate(self.palabras) if palabras < p}
+        if len({i for i, _ in contienen}) == 1:
+            return max(contienen, key=lambda x: x[1])
+        return None
+
+    def por_trigramas(self, clave: str):
+        """(id_personal, similitud) del vendedor más parecido si supera UMBRAL_TRIGRAMAS con
+           MARGEN_TRIGRAMAS sobre el mejor de otro id_personal; si no, None."""
+        tri = _trigramas(clave)
+        if not tri:
+            return None
+        comunes = Counter(i for t in tri for i in self.por_trigrama.get(t, ()))
+        mejores = {}
+        for i, n in comunes.items():
+            sim = n / (len(tri) + len(self.trigramas[i]) - n)
+            if sim > mejores.get(self.ids[i], 0.0):
+                mejores[self.ids[i]] = sim
+        ranking = sorted(mejores.items(), key=lambda x: x[1], reverse=True)
+        if not ranking or ranking[0][1] < UMBRAL_TRIGRAMAS:
+            return None
+        if len(ranking) > 1 and ranking[0][1] - ranking[1][1] < MARGEN_TRIGRAMAS:
+            return None
+        return ranking[0]
+
+def decidir_alias(clave: str, mapa: dict, indice: IndicePersonal):
+    """(id_personal o None, metodo, score) para una clave normalizada nueva."""
+    id_personal = resolver_vendedor(clave, mapa)
+    if id_personal is not None:
+        return id_personal, "exacto", 1.0
+    for metodo, buscar in (("tokens", indice.por_palabras), ("trigramas", indice.por_trigramas)):
+        match = buscar(clave)
+        if match:
+            return match[0], metodo, round(match[1], 4)
+    return None, "sin_match", None
+
+def resolver_vendedores(engine, serie: pd.Series, mapa: dict, firma: str = None) -> pd.Series:
+    """
+    vendedorId (int o None, dtype object) por fila de 'serie' usando VendedoresAlias:
+    carga los alias en un dict, decide solo los textos normalizados que todavía no tienen
+    alias (exacto / tokens / trigramas), los persiste y mapea el resultado a las filas con
+    un take sobre los códigos de factorize. 'firma' es la de PersonalDux con la que se armó
+    'mapa' (la misma que usó mapa_personal); si no se pasa, se consulta.
+    """
+    codes, unicos = pd.factorize(serie)
+    claves = [normalizar(v) for v in unicos]
+
+    if firma is None:
+        firma = firma_personal(engine)
+    alias = cargar_alias(engine, set(mapa.values()), firma)
+    nuevas = sorted({c for c in claves if c and c not in alias})
+    if nuevas:
+        indice = IndicePersonal.desde_cache(engine, firma)
+        decisiones = {c: decidir_alias(c, mapa, indice) for c in nuevas}
+        guardar_alias(engine, decisiones, firma)
+        alias.update({c: d[0] for c, d in decisiones.items()})
+        por_metodo = Counter(m for _, m, _ in decisiones.values())
+        print(f"🔖 Alias de vendedores nuevos: {len(decisiones)} "
+              f"({', '.join(f'{m}: {n}' for m, n in sorted(por_metodo.items()))})")
+
+    ids = pd.Series([alias.get(c) for c in claves] + [None], dtype=object).to_numpy()
+    return pd.Series(ids.take(codes), index=serie.index, dtype=object)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Microbenchmarks de los helpers de normalización y parseo que corren por celda o por fila.
+- Corpus sintéticos (semilla fija) con el mismo "ruido" que los exports de Dux: nombres con
+  acentos/comas/espacios de más, montos AR en texto mezclados con numéricos y basura,
+  fechas dd/mm/yyyy, ISO, con hora, Timestamp y NaN (ver bench_importadores.py).
+- Los helpers de normalizacion.py están memoizados: cada pasada arranca con las caches vacías,
+  así que la medición incluye el primer cálculo de cada valor y los aciertos de los repetidos.
+- Por helper reporta ns por llamada (mejor de --repeticiones pasadas) y asignaciones medidas
+  con tracemalloc en una pasada aparte: bytes pico y objetos que quedan vivos por llamada.
+  Las variantes vectorizadas (*_series) se miden sobre el corpus entero y se reportan por celda.
+- --baseline compara contra una corrida guardada (--guardar-baseline) y sale con código 1 si
+  algún helper quedó más lento o asigna más que --tolerancia.
+Uso:
+  python bench_helpers.py [--n 20000] [--repeticiones 5] [--baseline bench_helpers.json]
+"""
+
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import normalizacion
+from bench_importadores import APELLIDOS, CATEGORIAS, EMPRESAS, GASTOS_HEADERS, NOMBRES, _monto_ar, _sucio
+
+# Variaciones de tiempo por debajo de esto (ns/llamada) no se marcan como regresión
+MIN_NS_COMPARABLE = 200
+
+# ========= Corpus =========
+def corpus(n: int, seed: int = 17) -> dict:
+    rng = np.random.default_rng(seed)
+
+    def elegir(opciones):
+        return opciones[int(rng.integers(0, len(opciones)))]
+
+    base = date(2024, 1, 1)
+    fechas = []
+    for _ in range(n):
+        f = base + timedelta(days=int(rng.integers(0, 600)))
+        fechas.append(elegir([
+            f.strftime("%d/%m/%Y"), f.strftime("%d/%m/%Y"), f.strftime("%d-%m-%Y"), f.isoformat(),
+            f"{f.isoformat()} 13:17:50.656000", f"{f.strftime('%d/%m/%Y')} 00:00:00",
+            pd.Timestamp(f), np.nan, None, "sin fecha",
+        ]))
+
+    montos = []
+    for _ in range(n):
+        x = float(np.round(rng.gamma(2.0, 40000.0), 2))
+        montos.append(elegir([_monto_ar(x), _monto_ar(x), x, int(x), f" {_monto_ar(x)} ", "0,00", "", None,
+                              np.nan, "1,2,3"]))
+
+    personas = [f"{a}, {nm}" for a in APELLIDOS for nm in NOMBRES] + [f"{nm} {a}" for a in APELLIDOS for nm in NOMBRES]
+    return {
+        "headers": [_sucio(rng, elegir(GASTOS_HEADERS + ["Fecha Imputación", "Estado Facturación", "  Nº  Comprobante "]))
+                    for _ in range(n)],
+        "categorias": [_sucio(rng, elegir(CATEGORIAS)) if rng.random() < 0.95 else elegir([None, "", " , "])
+                       for _ in range(n)],
+        "comprobantes": [elegir([f"A-{int(rng.integers(1, 30)):05d}-{i:08d}", f" a-0001 - {i:08d} ", str(57339916 + i),
+                                 57339916 + i, None, np.nan]) for i in range(n)],
+        "montos": montos,
+        "fechas": fechas,
+        "vendedores": [_sucio(rng, elegir(personas)) if rng.random() < 0.95 else elegir([None, "", "  "])
+                       for _ in range(n)],
+        "nombres": [(elegir(APELLIDOS + EMPRESAS), elegir(NOMBRES + [None, ""])) for _ in range(n)],
+    }
+
+def helpers() -> list:
+    """[(nombre, fn, clave de corpus, modo)] con modo 'celda' (fn(x)), 'args' (fn(*x)) o 'serie'
+       (fn(pd.Series) una vez por corpus)."""
+    import importar_comprobantes_servicios as comp
+    import normalizacion as norm
+
+    return [
+        ("normalizacion.normalize_header_text", norm.normalize_header_text, "headers", "celda"),
+        ("normalizacion.normalize_categoria_raw", norm.normalize_categoria_raw, "categorias", "celda"),
+        ("normalizacion.normalize_categoria_series", norm.normalize_categoria_series, "categorias", "serie"),
+        ("normalizacion.normalize_comprobante_value", norm.normalize_comprobante_value, "comprobantes", "celda"),
+        ("normalizacion.normalize_comprobante_series", norm.normalize_comprobante_series, "comprobantes", "serie"),
+        ("normalizacion.normalizar", norm.normalizar, "vendedores", "celda"),
+        ("normalizacion.normalizar_series", norm.normalizar_series, "vendedores", "serie"),
+        ("normalizacion.armar_claves_nombre", norm.armar_claves_nombre, "nombres", "args"),
+        ("comprobantes.parse_decimal_ar", comp.parse_decimal_ar, "montos", "celda"),
+        ("comprobantes.parse_centavos_series", comp.parse_centavos_series, "montos", "serie"),
+        ("comprobantes.parse_date_dmy", comp.parse_date_dmy, "fechas", "celda"),
+        ("comprobantes.parse_date_series", comp.parse_date_series, "fechas", "serie"),
+    ]
+
+# ========= Medición =========
+def una_pasada(fn, datos, modo):
+    # en frío: cada pasada arranca sin memoización, como un export nuevo
+    normalizacion.cache_clear()
+    if modo == "serie":
+        return [fn(pd.Series(datos, dtype=object))]
+    if modo == "args":
+        return [fn(*x) for x in datos]
+    return [fn(x) for x in datos]
+
+def medir(fn, datos, modo, repeticiones: int) -> dict:
+    n = len(datos)
+    una_pasada(fn, datos[:100], modo)  # warm-up (caches de regex, imports perezosos)
+
+    mejor = float("inf")
+    gc.disable()
+    try:
+        for _ in range(repeticiones):
+            t0 = time.perf_counter_ns()
+            una_pasada(fn, datos, modo)
+            mejor = min(mejor, time.perf_counter_ns() - t0)
+    finally:
+        gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    resultado = una_pasada(fn, datos, modo)
+    _, pico = tracemalloc.get_traced_memory()
+    despues = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    vivos = sum(d.count_diff for d in despues.compare_to(antes, "filename"))
+    del resultado
+
+    return {
+        "ns_por_llamada": round(mejor / n, 1),
+        "bytes_pico_por_llamada": round(pico / n, 1),
+        "objetos_por_llamada": round(vivos / n, 2),
+    }
+
+def comparar(resultados: dict, baseline: dict, tolerancia: float) -> list:
+    """Regresiones [(helper, métrica, antes, ahora)] contra 'baseline'."""
+    regresiones = []
+    for nombre, res in resultados.items():
+        base = baseline.get(nombre)
+        if not base:
+            continue
+        ns, ns_antes = res["ns_por_llamada"], base["ns_por_llamada"]
+        if ns - ns_antes >= MIN_NS_COMPARABLE and ns > ns_antes * (1 + tolerancia):
+            regresiones.append((nombre, "ns_por_llamada", ns_antes, ns))
+        for metrica in ("bytes_pico_por_llamada", "objetos_por_llamada"):
+            if res[metrica] > base[metrica] * (1 + tolerancia) + 1:
+                regresiones.append((nombre, metrica, base[metrica], res[metrica]))
+    return regresiones
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks de los helpers de normalización/parseo.")
+    parser.add_argument("--n", type=int, default=20000, help="elementos por corpus")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--solo", nargs="+", metavar="TEXTO", help="solo los helpers cuyo nombre contenga alguno")
+    parser.add_argument("--baseline", metavar="RUTA", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--guardar-baseline", metavar="RUTA", help="guarda esta corrida como baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="cuánto peor puede dar un helper antes de marcarlo (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    datos = corpus(args.n)
+    resultados = {}
+    print(f"{'helper':<44} {'ns/llamada':>11} {'B pico/ll.':>11} {'objs/ll.':>9}")
+    for nombre, fn, clave, modo in helpers():
+        if args.solo and not any(t in nombre for t in args.solo):
+            continue
+        res = medir(fn, datos[clave], modo, args.repeticiones)
+        resultados[nombre] = res
+        print(f"{nombre:<44} {res['ns_por_llamada']:>11.1f} {res['bytes_pico_por_llamada']:>11.1f} "
+              f"{res['objetos_por_llamada']:>9.2f}")
+
+    if args.guardar_baseline:
+        Path(args.guardar_baseline).write_text(
+            json.dumps({"n": args.n, "resultados": resultados}, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["resultados"]
+        regresiones = comparar(resultados, baseline, args.tolerancia)
+        if regresiones:
+            print(f"\n❌ Regresiones contra {args.baseline} (tolerancia {args.tolerancia:.0%}):")
+            for nombre, metrica, antes, ahora in regresiones:
+                print(f"  {nombre:<44} {metrica:<24} {antes:>10.1f} -> {ahora:>10.1f}")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones contra {args.baseline}")
+
+if __name__ == "__main__":
+    main()
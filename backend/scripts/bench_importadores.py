@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark end-to-end de los importadores Dux contra una BD SQLite local (ver dialectos_db.py).
+- Genera exports sintéticos del tamaño pedido (se cachean en --dir, misma semilla = mismo archivo):
+  * gastos: layout de "Comprobantes de Servicios" (título + fila en blanco arriba de los
+    encabezados), montos numéricos mezclados con texto AR ("1.234,56"), fechas dd/mm/yyyy,
+    ISO y celdas fecha, comprobantes repetidos y nombres de proveedor/categoría sucios.
+  * clientes: layout del export de Clientes (título arriba de los encabezados) con las 27
+    columnas que valida procesar_excel, con vendedores escritos de varias formas contra un PersonalDux sintético.
+- Mide cada etapa por separado y reporta seg, filas/s y pico de RSS. Cada caso corre en un
+  proceso nuevo y con una BD nueva, así el pico de memoria y los tiempos son solo suyos.
+    gastos:   lectura / claves / mapeo (medidas dentro de iter_mapped_chunks) / upsert, con el mismo
+              loop que el importador; el total es de punta a punta (la suma de etapas, más el resto)
+    clientes: mapa_personal / lectura (+ limpieza) / procesar_excel (vendedores + upsert)
+- --comparar-categorias corre cada caso también con las columnas repetidas como object (sin
+  a_categorias, ver normalizacion.py) e imprime antes/después de tiempo por etapa, pico de RSS
+  y memoria de los DataFrames mapeados. Es una sola corrida por lado: las etapas que no dependen
+  de category (lectura, claves) varían ±30% entre corridas, así que el total no sirve para
+  decidir; mirar mapeo/upsert con --filas grande o repetir.
+- --baseline compara contra una corrida guardada (--guardar-baseline) y sale con código 1 si
+  alguna etapa o el pico de RSS empeoró más que --tolerancia.
+Uso:
+  python bench_importadores.py --filas 1000 100000 [--importadores gastos clientes]
+                               [--comparar-categorias] [--baseline bench_baseline.json] [--guardar-baseline bench_baseline.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+IMPORTADORES = ("gastos", "clientes")
+# Por debajo de esto una etapa es ruido de medición y no se marca como regresión
+MIN_SEG_COMPARABLE = 0.05
+
+GASTOS_HEADERS = [
+    "Tipo Comprobante", "Comprobante", "Fecha", "Fecha Imputacion", "Proveedor", "Detalles", "Total",
+    "Monto Pagado", "Saldo", "Estado Facturacion", "Personal", "Fecha Vencimiento", "Fecha Registro",
+    "Observaciones", "Personal Anula", "Fecha Anula",
+]
+CLIENTES_HEADERS = [
+    "ID", "Fecha Creacion", "Cliente", "Categoria Fiscal", "Tipo Documento", "Numero Documento",
+    "CUIT/CUIL", "Cobrador", "Tipo Cliente", "Persona Contacto", "No Editable",
+    "Lugar Entrega Por Defecto", "Tipo Comprobante Por Defecto", "Lista Precio Por Defecto",
+    "Habilitado", "Nombre Fantasia", "Codigo", "Correo Electronico", "Vendedor",
+    "Provincia", "Localidad", "Barrio", "Domicilio", "Telefono", "Celular", "Zona", "Condicion Pago",
+]
+
+NOMBRES = ["JUAN", "MARÍA JOSÉ", "GONZALO", "ARIANA JEZABEL", "FRANCISCO", "ELIZABETH", "LUCÍA", "MARTÍN"]
+APELLIDOS = ["PÉREZ", "GÓMEZ", "OROPE", "MAGNONE", "FERNÁNDEZ", "DÍAZ", "NÚÑEZ", "IBARRA"]
+EMPRESAS = ["EXPRESO BICENTENARIO", "ESTUDIO CREATIVO", "EDESUR", "Telecom Argentina", "AySA",
+            "IMPUESTO SELLOS", "SUELDOS", "Metrogas", "FERRETERIA SEBA", "Logística del Sur"]
+CATEGORIAS = ["LOGISTICA", "Logística ", "SERVICIOS PROFESIONALES", "COMISION VENDEDORES", "SUELDOS",
+              "IMPUESTOS, IMPUESTOS", "IMPUESTOS", "Luz", "Gas, gas", "ALQUILER"]
+
+# DDL (MySQL, se traduce con el dialecto) de las tablas que en producción crea Sequelize
+PERSONAL_DDL = """
+CREATE TABLE IF NOT EXISTS PersonalDux (
+  id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
+  id_personal INT NOT NULL,
+  nombre VARCHAR(255) NULL,
+  apellido_razon_social VARCHAR(255) NULL,
+  createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  deletedAt DATETIME NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+CLIENTES_DDL = """
+CREATE TABLE IF NOT EXISTS ClientesDux (
+  id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
+  fechaCreacion DATETIME NOT NULL,
+  """ + ",\n  ".join(f"{c} VARCHAR(255) NULL" for c in (
+    "cliente", "categoriaFiscal", "tipoDocumento", "numeroDocumento", "cuitCuil", "cobrador", "tipoCliente",
+    "personaContacto", "noEditable", "lugarEntregaPorDefecto", "tipoComprobantePorDefecto",
+    "listaPrecioPorDefecto", "habilitado", "nombreFantasia", "codigo", "correoElectronico", "vendedor",
+    "provincia", "localidad", "barrio", "domicilio", "telefono", "celular", "zona", "condicionPago")) + """,
+  createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  deletedAt DATETIME NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+# ========= Generación de exports sintéticos =========
+def _monto_ar(x: float) -> str:
+    entero, dec = f"{x:.2f}".split(".")
+    return f"{int(entero):,}".replace(",", ".") + "," + dec
+
+def _sucio(rng, s: str) -> str:
+    """Variantes que aparecen en los exports: mayúsculas/minúsculas y espacios de más."""
+    r = rng.random()
+    if r < 0.1:
+        s = s.lower()
+    elif r < 0.2:
+        s = f"  {s} "
+    return s
+
+def generar_gastos(path: Path, n: int, seed: int = 11):
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(seed)
+    proveedores = [f"{e}, {nom}, {nom}" if i % 3 == 0 else e
+                   for i, (e, nom) in enumerate((e, nom) for e in EMPRESAS for nom in NOMBRES)]
+    base = date(2024, 1, 1)
+    dias = rng.integers(0, 600, n)
+    totales = np.round(rng.gamma(2.0, 40000.0, n), 4)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Comprobantes")
+    ws.append(["Listado de Comprobantes de Servicios"])
+    ws.append([])
+    ws.append(GASTOS_HEADERS)
+    usados = []
+    for i in range(n):
+        f = base + timedelta(days=int(dias[i]))
+        forma = rng.random()
+        fecha = f if forma < 0.2 else (f.isoformat() if forma < 0.3 else f.strftime("%d/%m/%Y"))
+        if usados and rng.random() < 0.02:
+            comp = usados[int(rng.integers(0, len(usados)))]  # re-emitido: lo dedupea el importador
+        else:
+            comp = f"{rng.choice(['A', 'B', 'C'])}-{int(rng.integers(1, 30)):05d}-{i:08d}"
+            usados.append(comp)
+        total = float(totales[i])
+        pagado = total if rng.random() < 0.5 else 0.0
+        ws.append([
+            rng.choice(["FACTURA", "COMPROBANTE COMPRA", "NOTA DE CREDITO"]),
+            _sucio(rng, comp) if rng.random() < 0.05 else comp,
+            fecha,
+            (f + timedelta(days=int(rng.integers(0, 30)))).strftime("%d/%m/%Y"),
+            _sucio(rng, proveedores[int(rng.integers(0, len(proveedores)))]),
+            _sucio(rng, CATEGORIAS[int(rng.integers(0, len(CATEGORIAS)))]),
+            _monto_ar(total) if rng.random() < 0.3 else total,
+            _monto_ar(pagado) if rng.random() < 0.3 else pagado,
+            round(total - pagado, 4),
+            "EMITIDA" if rng.random() < 0.97 else "ANULADA",
+            "COMPRAS, COMPRAS" if rng.random() < 0.7 else "OROPE, ELIZABETH",
+            f.strftime("%d/%m/%Y") if rng.random() < 0.2 else None,
+            f"{f.isoformat()} {int(rng.integers(8, 19)):02d}:{int(rng.integers(0, 60)):02d}:00.000000",
+            "REPARACION VARIOS" if rng.random() < 0.15 else None,
+            None,
+            None,
+        ])
+    wb.save(path)
+
+def vendedores_sinteticos():
+    """[(id_personal, nombre, apellido)] del PersonalDux sintético."""
+    return [(100 + i, nom, ape) for i, (nom, ape) in enumerate((n, a) for a in APELLIDOS for n in NOMBRES)]
+
+def generar_clientes(path: Path, n: int, seed: int = 13):
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(seed)
+    vendedores = vendedores_sinteticos()
+    base = date(2018, 1, 1)
+
+    def vendedor_txt():
+        r = rng.random()
+        if r < 0.05:
+            return None
+        _, nom, ape = vendedores[int(rng.integers(0, len(vendedores)))]
+        if r < 0.6:
+            return f"{ape}, {nom}"
+        if r < 0.8:
+            return f"{nom} {ape}".title()  # "Nombre Apellido": lo resuelve el swap del último token
+        if r < 0.95:
+            return f" {ape.lower()}   {nom.lower()} "
+        return "VENDEDOR DESCONOCIDO"
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("ClientesDux")
+    ws.append(["Listado de Clientes"])
+    ws.append([f"Generado: {datetime(2025, 9, 1, 8, 30):%d/%m/%Y %H:%M}"])
+    ws.append(CLIENTES_HEADERS)
+    for i in range(n):
+        doc = int(rng.integers(20_000_000, 45_000_000))
+        ws.append([
+            i + 1,
+            (base + timedelta(days=int(rng.integers(0, 2500)))).strftime("%d/%m/%Y"),
+            f"{rng.choice(APELLIDOS)} {rng.choice(NOMBRES)} {i}",
+            rng.choice(["RESPONSABLE INSCRIPTO", "CONSUMIDOR FINAL", "MONOTRIBUTO"]),
+            rng.choice(["DNI", "CUIT"]),
+            str(doc),
+            f"20-{doc}-{int(rng.integers(0, 10))}",
+            None,
+            rng.choice(["MINORISTA", "MAYORISTA"]),
+            None,
+            "N",
+            None,
+            rng.choice(["FACTURA A", "FACTURA B"]),
+            rng.choice(["LISTA 1", "LISTA 2", "MAYORISTA"]),
+            "S" if rng.random() < 0.9 else "N",
+            None,
+            f"C{i:06d}",
+            f"cliente{i}@example.com" if rng.random() < 0.6 else None,
+            vendedor_txt(),
+            rng.choice(["BUENOS AIRES", "CORDOBA", "SANTA FE", "CABA"]),
+            rng.choice(["LA PLATA", "ROSARIO", "QUILMES", "CAPITAL"]),
+            None,
+            f"CALLE {int(rng.integers(1, 200))} {int(rng.integers(1, 5000))}",
+            None,
+            f"11{int(rng.integers(10_000_000, 99_999_999))}",
+            rng.choice(["NORTE", "SUR", "OESTE"]),
+            rng.choice(["CONTADO", "30 DIAS"]),
+        ])
+    wb.save(path)
+
+def archivo_sintetico(directorio: Path, importador: str, n: int) -> Path:
+    path = directorio / f"bench_{importador}_{n}.xlsx"
+    if not path.exists():
+        t0 = time.perf_counter()
+        (generar_gastos if importador == "gastos" else generar_clientes)(path, n)
+        print(f"  • generado {path.name} en {time.perf_counter() - t0:.1f}s")
+    return path
+
+# ========= Casos (cada uno corre en un proceso aparte) =========
+def pico_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # macOS: bytes; Linux: KB
+
+def usar_categorias(activo: bool):
+    # cada caso corre en su propio proceso: el switch no se filtra a los demás
+    import normalizacion
+    normalizacion.USAR_CATEGORIAS = activo
+
+def caso_gastos(path: Path, db_path: Path, chunk_rows: int = 5000, batch_size: int = 500,
+                categorias: bool = True) -> dict:
+    usar_categorias(categorias)
+    from importar_comprobantes_servicios import (
+        AdaptiveBatchSize, ImportStats, ensure_schema, iter_mapped_chunks, upsert_rows,
+    )
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    # las etapas de lectura/claves/mapeo las mide iter_mapped_chunks (ver StageTimer)
+    etapas = dict.fromkeys(("lectura", "claves", "mapeo", "upsert"), 0.0)
+    filas = 0
+    memoria_df = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        ensure_schema(engine)
+
+        # el mismo loop que main con un solo archivo
+        stats = ImportStats()
+        controller = AdaptiveBatchSize(batch_size)
+        t_total = time.perf_counter()
+        t_medicion = 0.0
+        for leidas, dfm in iter_mapped_chunks(path, chunk_rows=chunk_rows, tiempos=etapas):
+            filas += leidas
+            t0 = time.perf_counter()
+            upsert_rows(dfm, engine, batch_size=batch_size, max_retries=8, mode="multirow",
+                        stats=stats, controller=controller)
+            etapas["upsert"] += time.perf_counter() - t0
+            t0 = time.perf_counter()
+            memoria_df = max(memoria_df, int(dfm.memory_usage(deep=True).sum()))
+            t_medicion += time.perf_counter() - t0
+        # de punta a punta, sin lo que el bench mide aparte (memory_usage)
+        total_s = time.perf_counter() - t_total - t_medicion
+
+    with engine.connect() as conn:
+        escritas = conn.execute(text("SELECT COUNT(*) FROM ComprobantesServicios")).scalar()
+    return {"filas": filas, "escritas": escritas, "etapas": etapas, "total_s": total_s,
+            "pico_rss_mb": pico_rss_mb(), "memoria_df_mb": round(memoria_df / (1024 * 1024), 2)}
+
+def caso_clientes(path: Path, db_path: Path, categorias: bool = True) -> dict:
+    usar_categorias(categorias)
+    # El importador de clientes importa playwright a nivel módulo (descarga de Dux)
+    from dialectos_db import get_dialect
+    from alias_vendedores import firma_personal
+    from importar_clientes_dux_con_vendedor import (
+        construir_mapa_personal, ensure_schema, leer_export_clientes, procesar_excel,
+    )
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    dialect = get_dialect(engine)
+    with engine.begin() as conn:
+        for ddl in (PERSONAL_DDL, CLIENTES_DDL):
+            for stmt in dialect.ddl(ddl):
+                conn.execute(text(stmt))
+        conn.execute(text("INSERT INTO PersonalDux (id_personal, nombre, apellido_razon_social) VALUES (:i, :n, :a)"),
+                     [{"i": i, "n": n, "a": a} for i, n, a in vendedores_sinteticos()])
+    ensure_schema(engine)
+
+    etapas = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        firma = firma_personal(engine)
+        mapa = construir_mapa_personal(engine, firma)
+        etapas["mapa_personal"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        df = leer_export_clientes(path)
+        etapas["lectura"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        procesar_excel(df, mapa, engine, firma=firma)
+        etapas["procesar_excel"] = time.perf_counter() - t0
+
+    with engine.connect() as conn:
+        escritas, con_vendedor = conn.execute(text("SELECT COUNT(*), COUNT(vendedorId) FROM ClientesDux")).fetchone()
+    return {"filas": escritas, "escritas": escritas, "con_vendedor": con_vendedor,
+            "etapas": etapas, "pico_rss_mb": pico_rss_mb()}
+
+def correr_caso(importador: str, path: Path, db_path: Path, categorias: bool = True) -> dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        fn = caso_gastos if importador == "gastos" else caso_clientes
+        return pool.submit(fn, path, db_path, categorias=categorias).result()
+
+# ========= Reporte y baseline =========
+def comparar(resultados: dict, baseline: dict, tolerancia: float) -> list:
+    """Regresiones [(caso, métrica, antes, ahora)] de 'resultados' contra 'baseline'."""
+    regresiones = []
+    for caso, res in resultados.items():
+        base = baseline.get(caso)
+        if not base:
+            continue
+        for etapa, seg in res["etapas"].items():
+            antes = base["etapas"].get(etapa)
+            if antes is not None and seg >= MIN_SEG_COMPARABLE and seg > antes * (1 + tolerancia):
+                regresiones.append((caso, etapa, antes, seg))
+        if "total_s" in res and "total_s" in base and res["total_s"] > base["total_s"] * (1 + tolerancia):
+            regresiones.append((caso, "total_s", base["total_s"], res["total_s"]))
+        if res["pico_rss_mb"] > base["pico_rss_mb"] * (1 + tolerancia):
+            regresiones.append((caso, "pico_rss_mb", base["pico_rss_mb"], res["pico_rss_mb"]))
+    return regresiones
+
+def imprimir(caso: str, res: dict):
+    extra = f" ({res['con_vendedor']} con vendedor)" if "con_vendedor" in res else ""
+    print(f"\n{caso}: {res['filas']} filas, {res['escritas']} escritas{extra}, pico RSS {res['pico_rss_mb']} MB")
+    print(f"  {'etapa':<16} {'seg':>9} {'filas/s':>12}")
+    for etapa, seg in res["etapas"].items():
+        print(f"  {etapa:<16} {seg:>9.3f} {res['filas'] / seg if seg else 0:>12.0f}")
+    total = res.get("total_s", sum(res["etapas"].values()))
+    print(f"  {'total':<16} {total:>9.3f} {res['filas'] / total if total else 0:>12.0f}")
+
+def imprimir_antes_despues(caso: str, antes: dict, despues: dict):
+    """Tabla object (antes) vs category (después) de un mismo caso."""
+    filas = [(etapa, seg, despues["etapas"].get(etapa, 0.0)) for etapa, seg in antes["etapas"].items()]
+    filas.append(("total", antes.get("total_s", sum(antes["etapas"].values())),
+                  despues.get("total_s", sum(despues["etapas"].values()))))
+    filas.append(("pico_rss_mb", antes["pico_rss_mb"], despues["pico_rss_mb"]))
+    if "memoria_df_mb" in antes:
+        filas.append(("memoria_df_mb", antes["memoria_df_mb"], despues["memoria_df_mb"]))
+    print(f"\n{caso}: object -> category")
+    print(f"  {'métrica':<16} {'object':>10} {'category':>10} {'cambio':>8}")
+    for metrica, a, d in filas:
+        cambio = f"{(d - a) / a:+.0%}" if a else "-"
+        print(f"  {metrica:<16} {a:>10.3f} {d:>10.3f} {cambio:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end de los importadores Dux sobre SQLite.")
+    parser.add_argument("--filas", type=int, nargs="+", default=[1000, 100_000])
+    parser.add_argument("--importadores", nargs="+", choices=IMPORTADORES, default=list(IMPORTADORES))
+    parser.add_argument("--dir", default=str(Path(tempfile.gettempdir()) / "bench_importadores"),
+                        help="dónde generar/cachear los exports sintéticos")
+    parser.add_argument("--salida", metavar="RUTA", help="guarda los resultados en JSON")
+    parser.add_argument("--baseline", metavar="RUTA", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--guardar-baseline", metavar="RUTA", help="guarda esta corrida como baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="cuánto más lenta (o más pesada) puede ser una etapa antes de marcarla (0.25 = 25%%)")
+    parser.add_argument("--comparar-categorias", action="store_true",
+                        help="corre cada caso también sin columnas category y muestra antes/después")
+    args = parser.parse_args()
+
+    directorio = Path(args.dir)
+    directorio.mkdir(parents=True, exist_ok=True)
+
+    resultados = {}
+    for importador in args.importadores:
+        for n in args.filas:
+            caso = f"{importador}/{n}"
+            print(f"▶️ {caso}")
+            path = archivo_sintetico(directorio, importador, n)
+            with tempfile.TemporaryDirectory(prefix="bench_db_") as tmp:
+                resultados[caso] = correr_caso(importador, path, Path(tmp) / "bench.db")
+            imprimir(caso, resultados[caso])
+            if args.comparar_categorias:
+                with tempfile.TemporaryDirectory(prefix="bench_db_") as tmp:
+                    sin = correr_caso(importador, path, Path(tmp) / "bench.db", categorias=False)
+                resultados[f"{caso}/sin_categorias"] = sin
+                imprimir_antes_despues(caso, sin, resultados[caso])
+
+    datos = {"fecha": datetime.now().isoformat(timespec="seconds"), "resultados": resultados}
+    for ruta in (args.salida, args.guardar_baseline):
+        if ruta:
+            Path(ruta).write_text(json.dumps(datos, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["resultados"]
+        regresiones = comparar(resultados, baseline, args.tolerancia)
+        if regresiones:
+            print(f"\n❌ Regresiones contra {args.baseline} (tolerancia {args.tolerancia:.0%}):")
+            for caso, metrica, antes, ahora in regresiones:
+                print(f"  {caso:<18} {metrica:<16} {antes:>9.3f} -> {ahora:>9.3f}")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones contra {args.baseline}")
+
+if __name__ == "__main__":
+    main()
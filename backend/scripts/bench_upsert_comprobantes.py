@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark de escritura de ComprobantesServicios: compara el throughput de los modos
+de upsert_rows (executemany / multirow / staging) contra la BD del .env.
+- Trabaja sobre una tabla scratch `_bench_ComprobantesServicios` (CREATE TABLE ... LIKE),
+  la vacía entre modos y la borra al final: no toca datos reales.
+- Por modo mide dos pasadas: inserción (tabla vacía) y actualización (mismas claves).
+  Sin el salteo por hash (skip_unchanged=False): si no, la segunda pasada encuentra todas
+  las filas sin cambios y solo mide la consulta de hashes, no el upsert.
+- Las filas sintéticas no traen proveedor/categoría, así que tampoco escribe en las tablas de lookup.
+Uso:
+  python bench_upsert_comprobantes.py [--filas 20000] [--modos multirow executemany] [--batch-size 50]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from importar_comprobantes_servicios import WRITE_MODES, create_db_engine, ensure_schema, upsert_rows
+
+BENCH_TABLE = "_bench_ComprobantesServicios"
+
+def filas_sinteticas(n: int, seed: int = 7) -> pd.DataFrame:
+    """DataFrame con la forma que devuelve map_dataframe (sin proveedor/categoría)."""
+    rng = np.random.default_rng(seed)
+    base = date(2025, 1, 1)
+    fechas = [base + timedelta(days=int(d)) for d in rng.integers(0, 365, n)]
+    total = rng.integers(0, 10_000_000, n)  # centavos
+    pagado = np.where(rng.random(n) < 0.5, total, 0)
+    return pd.DataFrame({
+        "tipoComprobante": rng.choice(["FACTURA A", "FACTURA B", "FACTURA C"], n),
+        "comprobante": [f"B{i:04d}-{j:08d}" for i, j in zip(rng.integers(1, 20, n), range(n))],
+        "fecha": fechas,
+        "fechaImputacion": fechas,
+        "proveedorNombre": None,
+        "categoriaNombre": None,
+        "detalles": rng.choice(["Luz", "Gas", "Internet", "Alquiler", None], n),
+        "total": total,
+        "montoPagado": pagado,
+        "saldo": total - pagado,
+        "estadoFacturacion": "EMITIDA",
+        "personal": rng.choice(["ADMINISTRACION", "COMPRAS"], n),
+        "fechaVencimiento": fechas,
+        "fechaRegistro": fechas,
+        "observaciones": None,
+        "personalAnula": None,
+        "fechaAnula": None,
+    })
+
+def medir(df, engine, mode, batch_size):
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        upsert_rows(df, engine, batch_size=batch_size, mode=mode, table=BENCH_TABLE, skip_unchanged=False)
+    return time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara los modos de escritura de upsert_rows.")
+    parser.add_argument("--filas", type=int, default=20000)
+    parser.add_argument("--modos", nargs="+", choices=WRITE_MODES, default=list(WRITE_MODES))
+    parser.add_argument("--batch-size", type=int, default=50, help="filas por transacción en modo executemany")
+    args = parser.parse_args()
+
+    engine = create_db_engine(local_infile="staging" in args.modos)
+    ensure_schema(engine)
+    df = filas_sinteticas(args.filas)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        conn.execute(text(f"CREATE TABLE {BENCH_TABLE} LIKE ComprobantesServicios"))
+    try:
+        print(f"{'modo':<12} {'pasada':<12} {'seg':>8} {'filas/s':>10}")
+        for mode in args.modos:
+            with engine.begin() as conn:
+                conn.execute(text(f"TRUNCATE TABLE {BENCH_TABLE}"))
+            for pasada in ("insert", "update"):
+                seg = medir(df, engine, mode, args.batch_size)
+                print(f"{mode:<12} {pasada:<12} {seg:>8.2f} {len(df) / seg:>10.0f}")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+
+if __name__ == "__main__":
+    main()
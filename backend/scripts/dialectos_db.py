@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+Capa fina de dialecto SQL para los importadores Python (Dux).
+- Producción corre sobre MySQL/MariaDB; SQLite sirve para perfilar o probar el pipeline
+  completo sin servidor, contra un archivo local:
+    IMPORTADORES_DB_URL=sqlite:///bench.db python importar_comprobantes_servicios.py archivo.xls
+- Acá vive todo lo que cambia entre motores: upsert, INSERT IGNORE, traducción de DDL,
+  introspección de columnas/índices, ajustes de sesión, límites de statement y errores
+  de contención. El resto del SQL de los importadores ya es portable.
+- get_dialect(engine_o_conn) elige la implementación según engine.dialect.name.
+"""
+
+import os
+import re
+
+from sqlalchemy import text
+
+DB_URL_ENV = "IMPORTADORES_DB_URL"
+
+def database_url(default: str) -> str:
+    """URL de la BD: IMPORTADORES_DB_URL si está definida (p.ej. sqlite:///bench.db), si no 'default'."""
+    return os.getenv(DB_URL_ENV) or default
+
+class MySQLDialect:
+    name = "mysql"
+    # ON DUPLICATE KEY UPDATE cuenta 2 affected-rows por fila actualizada
+    upsert_counts_updates_twice = True
+    # Sin tope de parámetros por statement (manda max_allowed_packet)
+    max_params = None
+    supports_load_data = True
+
+    def insert_ignore(self, table: str) -> str:
+        return f"INSERT IGNORE INTO {table}"
+
+    def upsert_clause(self, update_cols) -> str:
+        """Sufijo de INSERT ... VALUES para pisar update_cols si la fila ya existe."""
+        return f"ON DUPLICATE KEY UPDATE {', '.join(f'{c}=VALUES({c})' for c in update_cols)}"
+
+    def upsert_stmt(self, table, cols):
+        """INSERT ... ON DUPLICATE KEY UPDATE (SQLAlchemy Core) sobre 'table' para las columnas
+           'cols', sin valores: se ejecuta con conn.execute(stmt, fila) o con una lista de filas."""
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+        pk = {c.name for c in table.primary_key.columns}
+        stmt = mysql_insert(table)
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in cols if c not in pk})
+
+    def ddl(self, sql: str) -> list:
+        return [sql]
+
+    def setup_session(self, conn):
+        conn.exec_driver_sql("SET SESSION innodb_lock_wait_timeout = 120")
+        conn.exec_driver_sql("SET SESSION transaction_isolation = 'READ-COMMITTED'")
+
+    def max_statement_bytes(self, conn):
+        """max_allowed_packet del server, o None si no se pudo leer."""
+        try:
+            return int(conn.exec_driver_sql("SELECT @@max_allowed_packet").scalar())
+        except Exception:
+            return None
+
+    def column_exists(self, conn, table: str, column: str) -> bool:
+        return bool(conn.execute(
+            text("""SELECT 1
+                    FROM information_schema.columns
+                    WHERE table_schema=DATABASE() AND table_name=:t AND column_name=:c
+                    LIMIT 1"""),
+            {"t": table, "c": column}
+        ).fetchone())
+
+    def index_exists(self, conn, table: str, index_name: str) -> bool:
+        return bool(conn.execute(
+            text("""SELECT 1
+                    FROM information_schema.statistics
+                    WHERE table_schema=DATABASE() AND table_name=:t AND index_name=:i
+                    LIMIT 1"""),
+            {"t": table, "i": index_name}
+        ).fetchone())
+
+    def is_lock_error(self, exc) -> bool:
+        """Lock wait timeout (1205) o deadlock (1213): errores de contención reintentables."""
+        return any(code in str(getattr(exc, "orig", exc)) for code in ("1205", "1213"))
+
+class SQLiteDialect(MySQLDialect):
+    name = "sqlite"
+    # ON CONFLICT DO UPDATE cuenta 1 por fila, insertada o actualizada
+    upsert_counts_updates_twice = False
+    # SQLITE_MAX_VARIABLE_NUMBER por defecto desde 3.32
+    max_params = 32766
+    supports_load_data = False
+
+    _AUTO_PK_RE = re.compile(r"\b\w+(?:\s+UNSIGNED)?\s+PRIMARY KEY\s+AUTO_INCREMENT\b", re.I)
+    _TABLE_OPTS_RE = re.compile(r"\)\s*ENGINE\s*=.*$", re.I | re.S)
+    _KEY_RE = re.compile(r",\s*KEY\s+(\w+)\s*(\([^)]*\))", re.I)
+    _UNIQUE_KEY_RE = re.compile(r"\bUNIQUE KEY\s+(\w+)\s*(\([^)]*\))", re.I)
+    _ALTER_UNIQUE_RE = re.compile(r"^\s*ALTER TABLE\s+(\w+)\s+ADD UNIQUE KEY\s+(\w+)\s*(\([^)]*\))\s*$", re.I)
+    _CREATE_TABLE_RE = re.compile(r"CREATE TABLE(?: IF NOT EXISTS)?\s+(\w+)", re.I)
+
+    def insert_ignore(self, table: str) -> str:
+        return f"INSERT OR IGNORE INTO {table}"
+
+    def upsert_clause(self, update_cols) -> str:
+        # sin conflict target: aplica a cualquier UNIQUE/PK (SQLite >= 3.35)
+        return f"ON CONFLICT DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in update_cols)}"
+
+    def upsert_stmt(self, table, cols):
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+        pk = [c.name for c in table.primary_key.columns]
+        stmt = sqlite_insert(table)
+        return stmt.on_conflict_do_update(index_elements=pk,
+                                          set_={c: stmt.excluded[c] for c in cols if c not in pk})
+
+    def ddl(self, sql: str) -> list:
+        """Traduce el DDL MySQL de los importadores a SQLite. Los KEY secundarios de un
+           CREATE TABLE salen como CREATE INDEX aparte (SQLite no los acepta inline)."""
+        alter = self._ALTER_UNIQUE_RE.match(sql)
+        if alter:
+            tabla, indice, cols = alter.groups()
+            return [f"CREATE UNIQUE INDEX {indice} ON {tabla} {cols}"]
+
+        sql = self._AUTO_PK_RE.sub("INTEGER PRIMARY KEY AUTOINCREMENT", sql)
+        sql = re.sub(r"\s+UNSIGNED\b", "", sql, flags=re.I)
+        sql = re.sub(r"\s+ON UPDATE CURRENT_TIMESTAMP\b", "", sql, flags=re.I)
+        sql = self._TABLE_OPTS_RE.sub(")", sql)
+        sql = self._UNIQUE_KEY_RE.sub(r"CONSTRAINT \1 UNIQUE \2", sql)
+
+        extras = []
+        tabla = self._CREATE_TABLE_RE.search(sql)
+        if tabla:
+            for indice, cols in self._KEY_RE.findall(sql):
+                extras.append(f"CREATE INDEX IF NOT EXISTS {indice} ON {tabla.group(1)} {cols}")
+            sql = self._KEY_RE.sub("", sql)
+        return [sql] + extras
+
+    def setup_session(self, conn):
+        conn.exec_driver_sql("PRAGMA busy_timeout = 120000")
+
+    def max_statement_bytes(self, conn):
+        return 1_000_000_000  # SQLITE_MAX_SQL_LENGTH por defecto
+
+    def column_exists(self, conn, table: str, column: str) -> bool:
+        return any(r[1] == column for r in conn.exec_driver_sql(f"PRAGMA table_info({table})"))
+
+    def index_exists(self, conn, table: str, index_name: str) -> bool:
+        return any(r[1] == index_name for r in conn.exec_driver_sql(f"PRAGMA index_list({table})"))
+
+    def is_lock_error(self, exc) -> bool:
+        return "database is locked" in str(getattr(exc, "orig", exc))
+
+_DIALECTS = {"mysql": MySQLDialect(), "mariadb": MySQLDialect(), "sqlite": SQLiteDialect()}
+
+def get_dialect(bind):
+    """Adaptador para un Engine o Connection de SQLAlchemy."""
+    nombre = bind.dialect.name
+    if nombre not in _DIALECTS:
+        raise ValueError(f"Dialecto no soportado por los importadores: {nombre}")
+    return _DIALECTS[nombre]
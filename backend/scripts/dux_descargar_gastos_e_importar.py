@@ -585,6 +585,8 @@ async def run():
 
         print("🚚 Ejecutando importador…")
         cmd = [sys.executable, str(IMPORTADOR), str(xls_destino)]
+        if "--force" in sys.argv[1:]:
+            cmd.append("--force")  # reimportar aunque el ledger ya tenga este mismo archivo
         r = subprocess.run(cmd, cwd=BASE_DIR, capture_output=True, text=True)
 
         if r.returncode == 0:
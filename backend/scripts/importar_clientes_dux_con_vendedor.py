@@ -2,13 +2,17 @@ import asyncio
 import os
 from pathlib import Path
 from datetime import datetime
+import numpy as np
 import pandas as pd
-import unicodedata
 from sqlalchemy import create_engine, MetaData, Table, text
-from sqlalchemy.dialects.mysql import insert as mysql_insert
 from dotenv import load_dotenv
 from playwright.async_api import async_playwright, TimeoutError as PwTimeout
 
+from schema_versiones import run_schema_steps
+from dialectos_db import database_url, get_dialect
+from normalizacion import a_categorias
+from alias_vendedores import ALIAS_SCHEMA_STEPS, firma_personal, mapa_personal, resolver_vendedores
+
 # 📦 Cargar variables de entorno
 load_dotenv(dotenv_path=Path(__file__).resolve().parents[1] / ".env")
 USUARIO = os.getenv("DUX_USER", "")
@@ -21,71 +25,40 @@ DB_PORT = os.getenv("DB_PORT", "3306")
 DB_NAME = os.getenv("DB_NAME")
 DB_DIALECT = os.getenv("DB_DIALECT", "mysql")
 
-DATABASE_URL = f"{DB_DIALECT}+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
-# ---------- Normalización vendedores ----------
-def normalizar(s: str) -> str:
-    if not isinstance(s, str):
-        return ""
-    s = s.strip().upper()
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-    s = " ".join(s.split())
-    return s
-
-def armar_claves_nombre(apellido: str, nombre: str):
-    ape = normalizar(apellido or "")
-    nom = normalizar(nombre or "")
-    claves = set()
-    if ape or nom:
-        if ape and nom:
-            claves.add(f"{ape}, {nom}")
-            claves.add(f"{ape} {nom}")
-        else:
-            claves.add(ape or nom)
-    return claves
+DATABASE_URL = database_url(f"{DB_DIALECT}+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+
+# Filas por upsert multi-fila: cada lote es su propia transacción, así ClientesDux no queda
+# bloqueada todo el archivo mientras el backend Node la lee
+UPSERT_CHUNK_ROWS = 500
+
+# Columnas del export con pocos valores distintos y muchas repeticiones: van como category
+CATEGORY_COLS = ["vendedor", "provincia", "localidad", "zona"]
+
+def _schema_vendedor_id(conn):
+    # Verificar si la columna ya existe
+    if not get_dialect(conn).column_exists(conn, "ClientesDux", "vendedorId"):
+        conn.execute(text("ALTER TABLE ClientesDux ADD vendedorId INT NULL"))
+
+def _schema_idx_vendedor_id(conn):
+    # Verificar si el índice ya existe
+    if not get_dialect(conn).index_exists(conn, "ClientesDux", "idx_clientesdux_vendedorId"):
+        conn.execute(text("CREATE INDEX idx_clientesdux_vendedorId ON ClientesDux (vendedorId)"))
+
+# Pasos de DDL del importador, en orden (ver schema_versiones.py). Agregar siempre al final.
+SCHEMA_STEPS = [
+    ("clientesdux/001_vendedorId", _schema_vendedor_id),
+    ("clientesdux/002_idx_vendedorId", _schema_idx_vendedor_id),
+] + ALIAS_SCHEMA_STEPS
 
 def ensure_schema(engine):
-    """Asegura columna vendedorId e índice, compatible con MySQL/MariaDB viejos."""
-    with engine.begin() as conn:
-        # Verificar si la columna ya existe
-        existe_col = conn.execute(text("""
-            SELECT COUNT(*)
-            FROM INFORMATION_SCHEMA.COLUMNS
-            WHERE TABLE_SCHEMA = :db
-              AND TABLE_NAME = 'ClientesDux'
-              AND COLUMN_NAME = 'vendedorId'
-        """), {"db": DB_NAME}).scalar()
-
-        if not existe_col:
-            conn.execute(text("ALTER TABLE ClientesDux ADD vendedorId INT NULL"))
-
-        # Verificar si el índice ya existe
-        existe_idx = conn.execute(text("""
-            SELECT COUNT(1)
-            FROM INFORMATION_SCHEMA.STATISTICS
-            WHERE TABLE_SCHEMA = :db
-              AND TABLE_NAME = 'ClientesDux'
-              AND INDEX_NAME = 'idx_clientesdux_vendedorId'
-        """), {"db": DB_NAME}).scalar()
-
-        if not existe_idx:
-            conn.execute(text("CREATE INDEX idx_clientesdux_vendedorId ON ClientesDux (vendedorId)"))
-
-def construir_mapa_personal(engine):
-    """Devuelve dict { 'APELLIDO, NOMBRE' : id_personal } con variantes normalizadas."""
-    q = """
-    SELECT id_personal, nombre, apellido_razon_social
-    FROM PersonalDux
-    WHERE deletedAt IS NULL
-    """
-    dfp = pd.read_sql(q, engine)
-    mapa = {}
-    for _, r in dfp.iterrows():
-        claves = armar_claves_nombre(r.get("apellido_razon_social"), r.get("nombre"))
-        for k in claves:
-            mapa.setdefault(k, int(r["id_personal"]))
-    return mapa
+    """Asegura columna vendedorId e índice, compatible con MySQL/MariaDB viejos (y SQLite).
+       Los pasos ya aplicados quedan marcados: sin pendientes no consulta INFORMATION_SCHEMA."""
+    run_schema_steps(engine, SCHEMA_STEPS)
+
+def construir_mapa_personal(engine, firma: str = None):
+    """Devuelve dict { 'APELLIDO, NOMBRE' : id_personal } con variantes normalizadas.
+       Cacheado en disco mientras PersonalDux no cambie (ver alias_vendedores.mapa_personal)."""
+    return mapa_personal(engine, firma)
 
 # ---------- Utilidades Playwright (robustas, mismas del script que funciona) ----------
 SEL = {
@@ -424,46 +397,46 @@ async def run():
         xls_original.rename(xls_sanitizado)
 
         print(f"✅ Archivo descargado correctamente: {xls_sanitizado}")
-        xlsx_path = convertir_a_xlsx(xls_sanitizado)
+        df_clientes = leer_export_clientes(xls_sanitizado)
 
         # 🔗 DB engine + schema + mapa de vendedores
         engine = create_engine(DATABASE_URL)
         ensure_schema(engine)
-        mapa_vendedores = construir_mapa_personal(engine)
+        firma = firma_personal(engine)
+        mapa_vendedores = construir_mapa_personal(engine, firma)
 
-        procesar_excel(xlsx_path, mapa_vendedores, engine)
+        procesar_excel(df_clientes, mapa_vendedores, engine, firma=firma)
         guardar_log("✅ Importación exitosa")
 
-# ---------- Conversión y carga ----------
-def convertir_a_xlsx(path_xls: Path) -> Path:
-    print(f"🔁 Convirtiendo {path_xls.name} a .xlsx...")
-    from openpyxl import Workbook
-
-    df = pd.read_excel(path_xls, header=3, engine="xlrd", sheet_name=0)
-    columnas_limpias = []
-    for c in df.columns:
-        nombre = str(c).encode("ascii", "ignore").decode(errors="ignore")
-        nombre = nombre.replace("\x1e", "").replace("\n", " ").replace("\r", "").strip()
-        columnas_limpias.append(nombre if nombre else "columna_sin_nombre")
-    df.columns = columnas_limpias
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "ClientesDux"
-    ws.append(df.columns.tolist())
-    for row in df.itertuples(index=False, name=None):
-        row_limpia = [(v.encode("utf-8", "ignore").decode(errors="ignore").replace("\x1e", "") if isinstance(v, str) else v) for v in row]
-        ws.append(row_limpia)
-
-    path_xlsx = path_xls.with_suffix(".xlsx")
-    wb.save(path_xlsx)
-    print(f"✅ Archivo convertido: {path_xlsx.name}")
-    path_xls.unlink(missing_ok=True)
-    return path_xlsx
-
-def procesar_excel(ruta_archivo, mapa_vendedores: dict, engine):
-    print(f"📖 Leyendo Excel sin encabezado, desde fila 0: {ruta_archivo}")
-    df = pd.read_excel(ruta_archivo, header=None)
+# ---------- Lectura y carga ----------
+def limpiar_celdas(df: pd.DataFrame) -> pd.DataFrame:
+    """Quita de las celdas texto los surrogates sueltos y los separadores \x1e que trae el .xls
+       de Dux, con operaciones vectorizadas por columna. Números, fechas y NaN quedan igual."""
+    for c in df.columns[(df.dtypes == object).to_numpy()]:
+        serie = df[c]
+        es_txt = np.fromiter((isinstance(v, str) for v in serie.to_numpy()), dtype=bool, count=len(serie))
+        if not es_txt.any():
+            continue
+        txt = (serie[es_txt].str.encode("utf-8", "ignore").str.decode("utf-8")
+               .str.replace("\x1e", "", regex=False))
+        df[c] = serie.where(~es_txt, txt)
+    return df
+
+def leer_export_clientes(path_xls: Path) -> pd.DataFrame:
+    """Lee el export de Clientes de Dux en memoria, sin encabezado: procesar_excel asigna las
+       columnas por posición y descarta las filas de título/encabezados (ver filas_de_clientes)."""
+    print(f"📖 Leyendo export de Clientes: {path_xls.name}")
+    return limpiar_celdas(pd.read_excel(path_xls, header=None, sheet_name=0))
+
+def filas_de_clientes(df: pd.DataFrame) -> pd.DataFrame:
+    """Solo las filas de clientes del export: el título y los encabezados vienen como filas
+       (se lee sin header) y se reconocen porque no tienen ID numérico."""
+    return df[pd.to_numeric(df["id"], errors="coerce").notna()].copy()
+
+def procesar_excel(df: pd.DataFrame, mapa_vendedores: dict, engine, chunk_rows: int = UPSERT_CHUNK_ROWS,
+                   firma: str = None):
+    """Mapea el export de Clientes (ver leer_export_clientes), resuelve vendedorId y upsertea.
+       'firma' es la de PersonalDux con la que se armó mapa_vendedores (ver construir_mapa_personal)."""
     print("🧪 Primeras filas:")
     print(df.head())
 
@@ -471,7 +444,7 @@ def procesar_excel(ruta_archivo, mapa_vendedores: dict, engine):
     cols = df.shape[1]
     if cols != 27:
         # pista rápida para diagnosticar qué bajó
-        primeras_vals = [str(x).upper() for x in df.iloc[0, :min(cols, 6)].tolist()]
+        primeras_vals = [str(x).upper() for x in df.iloc[0, :min(cols, 6)].tolist()] if len(df) else []
         msg = (
             f"❌ Layout inesperado: el XLS tiene {cols} columnas y esperaba 27 (Clientes).\n"
             f"Pista primeras celdas fila 0: {primeras_vals}\n"
@@ -488,43 +461,37 @@ def procesar_excel(ruta_archivo, mapa_vendedores: dict, engine):
         "provincia", "localidad", "barrio", "domicilio", "telefono", "celular", "zona", "condicionPago"
     ]
 
+    df = filas_de_clientes(df)
+    a_categorias(df, CATEGORY_COLS)
+
     df['fechaCreacion'] = pd.to_datetime(df['fechaCreacion'], format="%d/%m/%Y", errors="coerce")
     df["habilitado"] = df["habilitado"].map(lambda x: 1 if str(x).strip().upper() == "S" else 0)
 
-    def resolver_vendedor_id(vtxt: str):
-        clave = normalizar(vtxt or "")
-        if not clave:
-            return None
-        if clave in mapa_vendedores:
-            return mapa_vendedores[clave]
-        partes = clave.split(" ")
-        if len(partes) >= 2:
-            nombre = " ".join(partes[:-1])
-            apellido = partes[-1]
-            for k in armar_claves_nombre(apellido, nombre):
-                if k in mapa_vendedores:
-                    return mapa_vendedores[k]
-        return None
-
-    df["vendedorId"] = df["vendedor"].apply(resolver_vendedor_id)
+    # Una resolución por vendedor distinto, no por fila: alias persistidos + matching difuso
+    # solo para los textos que todavía no tienen alias (ver alias_vendedores.py)
+    df["vendedorId"] = resolver_vendedores(engine, df["vendedor"], mapa_vendedores, firma)
 
     no_match = df[(df["vendedor"].notna()) & (df["vendedor"] != "") & (df["vendedorId"].isna())]["vendedor"].unique()
     if len(no_match):
         vista = [str(x) for x in no_match[:20]]
         print(f"⚠️ Vendedores sin match ({len(no_match)}): {vista}{' ...' if len(no_match) > 20 else ''}")
 
-    print("🛠 Insertando con ON DUPLICATE KEY UPDATE...")
+    print(f"🛠 Insertando con ON DUPLICATE KEY UPDATE en lotes de {chunk_rows}...")
     metadata = MetaData()
     clientes_table = Table("ClientesDux", metadata, autoload_with=engine)
 
-    with engine.begin() as conn:
-        for _, row in df.iterrows():
-            row_data = row.where(pd.notnull(row), None).to_dict()
-            insert_stmt = mysql_insert(clientes_table).values(row_data)
-            update_stmt = insert_stmt.on_duplicate_key_update({
-                k: insert_stmt.inserted[k] for k in row_data.keys() if k != 'id'
-            })
-            conn.execute(update_stmt)
+    # Upsert del dialecto (ON DUPLICATE KEY UPDATE en MySQL, ON CONFLICT DO UPDATE en SQLite),
+    # armado una vez: SQLAlchemy lo compila una sola vez y cada lote va como executemany,
+    # que el driver manda como INSERT multi-fila
+    upsert_stmt = get_dialect(engine).upsert_stmt(clientes_table, list(df.columns))
+
+    # NaN/NaT -> None una sola vez para todo el DataFrame, no fila por fila
+    filas = df.astype(object).where(df.notna(), None).to_dict("records")
+    with engine.connect() as conn:
+        for start in range(0, len(filas), chunk_rows):
+            with conn.begin():
+                conn.execute(upsert_stmt, filas[start:start + chunk_rows])
+            print(f"  • {min(start + chunk_rows, len(filas))}/{len(filas)} clientes upsertados...")
 
     print("✅ Clientes importados (actualizados si existían)")
 
@@ -3,9 +3,11 @@
 
 """
 Importa una planilla de 'Comprobantes de Servicios' a la BD.
-- Lee .xls o .xlsx (aunque tenga filas "título" arriba de los encabezados)
+- Lee .xls o .xlsx (aunque tenga filas "título" arriba de los encabezados), en streaming por chunks
+- Acepta varios archivos o directorios (backfills): los parsea/mapea en paralelo en un pool de
+  procesos, dedupea por `comprobante` entre todos y escribe en una sola pasada
 - Auto-detecta la fila de encabezados buscando columnas clave (Tipo Comprobante, Comprobante, Fecha, Total)
-- Normaliza montos en formato AR (puntos de miles, coma decimal)
+- Normaliza montos en formato AR (puntos de miles, coma decimal) a centavos enteros, sin floats
 - Parsea fechas dd/mm/yyyy y también ISO (YYYY-MM-DD [HH:MM:SS[.fff]])
 - Hace UPSERT masivo en lotes:
   * ProveedoresServicios (crea proveedor si no existe)
@@ -13,6 +15,8 @@ Importa una planilla de 'Comprobantes de Servicios' a la BD.
   * ComprobantesServicios
     - Clave natural histórica: (tipoComprobante, comprobante, fecha)
     - **Anti-duplicado fuerte por `comprobante`**: dedupe en DataFrame + índice UNIQUE opcional
+- Registra cada corrida en ImportacionesArchivos (sha256, filas, rango de fechas, resultado):
+  si el archivo es idéntico a uno ya importado OK, termina sin leerlo (--force para reimportar)
 Requisitos:
   pip install pandas SQLAlchemy PyMySQL python-dotenv xlrd openpyxl
 """
@@ -21,16 +25,29 @@ import os
 import sys
 import math
 import re
+import json
+import time
+import hashlib
+from contextlib import contextmanager
+from itertools import chain, islice
 from pathlib import Path
 from datetime import datetime
-from decimal import Decimal, InvalidOperation
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
 
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy import create_engine, text, bindparam
+from sqlalchemy.engine import Engine, make_url
 from dotenv import load_dotenv
 import warnings
 
+from schema_versiones import run_schema_steps
+from dialectos_db import MySQLDialect, database_url, get_dialect
+from normalizacion import (
+    a_categorias, lookup_key, map_unique, normalize_categoria_raw, normalize_categoria_series,
+    normalize_comprobante_series, normalize_header_text,
+)
+
 # Silenciar warnings de parseo de fechas ISO con dayfirst
 warnings.filterwarnings("ignore", message="Parsing dates in %Y-%m-%d")
 
@@ -43,7 +60,8 @@ DB_PORT = os.getenv("DB_PORT", "3306")
 DB_NAME = os.getenv("DB_NAME")
 DB_DIALECT = os.getenv("DB_DIALECT", "mysql")
 
-DATABASE_URL = f"{DB_DIALECT}+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# IMPORTADORES_DB_URL (p.ej. sqlite:///bench.db) la pisa para correr sin MySQL, ver dialectos_db.py
+DATABASE_URL = database_url(f"{DB_DIALECT}+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
 
 # ============ Helpers ============
 AR_MONEY_RE = re.compile(r"[.\s]")  # para quitar puntos de miles y espacios
@@ -64,6 +82,122 @@ def parse_decimal_ar(value):
     except InvalidOperation:
         return Decimal("0")
 
+# Montos: enteros en centavos (int64) desde el parseo hasta la escritura. DECIMAL(15,2)
+# llega hasta 9.999.999.999.999,99 -> 10**15 - 1 centavos, holgado dentro de int64.
+MONEY_COLS = ["total", "montoPagado", "saldo"]
+MAX_CENTAVOS = 10**15 - 1
+CENTAVOS_RE = re.compile(r"^([+-]?)(\d*)(?:\.(\d*))?$")
+
+def decimal_to_centavos(d: Decimal) -> int:
+    """Decimal -> centavos, redondeando como MySQL al guardar en DECIMAL(15,2) (mitad hacia
+       afuera). NaN/Infinity -> 0; fuera de rango es error (en la BD también lo sería)."""
+    if not d.is_finite():
+        return 0
+    c = int(d.scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    if abs(c) > MAX_CENTAVOS:
+        raise ValueError(f"Monto fuera de rango para DECIMAL(15,2): {d}")
+    return c
+
+def strip_text_cells(vals: np.ndarray) -> pd.Series:
+    """str.strip() de las celdas texto; NaN/None en las que no son str. Tolera columnas
+       sin ningún texto (todo fechas/números/NaN), donde el accessor .str no se deja usar."""
+    serie = pd.Series(vals, dtype=object)
+    try:
+        return serie.str.strip()
+    except AttributeError:
+        return pd.Series(np.nan, index=serie.index, dtype=object)
+
+# Lo mismo que AR_MONEY_RE + replace(",", ".") en una sola pasada de str.translate
+# (\s de re = str.isspace(); no hay espacios Unicode por encima de U+3000)
+AR_MONEY_TABLE = str.maketrans({**{c: None for c in map(chr, range(0x3001)) if c.isspace()},
+                                ".": None, ",": "."})
+_SEP_BLOQUE = "\x00"
+
+def clean_ar_money(textos: list) -> list:
+    """Limpieza AR de parse_decimal_ar (sin puntos de miles ni espacios, coma -> punto) para
+       una lista de textos: se unen en un solo string y se traducen de una vez."""
+    bloque = _SEP_BLOQUE.join(textos)
+    if bloque.count(_SEP_BLOQUE) != len(textos) - 1:  # algún texto trae el separador
+        return [t.translate(AR_MONEY_TABLE) for t in textos]
+    return bloque.translate(AR_MONEY_TABLE).split(_SEP_BLOQUE)
+
+def _plano_a_centavos(s: str):
+    """'-1234.565' -> -123457 (mitad hacia afuera, como decimal_to_centavos), o None si 's'
+       no es un decimal plano o no entra en DECIMAL(15,2)."""
+    m = CENTAVOS_RE.match(s)
+    if not m or not (m[2] or m[3]) or len(m[2]) > 13:
+        return None
+    dec = m[3] or ""
+    c = int(m[2] or 0) * 100 + int(dec[:2].ljust(2, "0")) + (dec[2:3] >= "5")
+    return -c if m[1] == "-" else c
+
+def parse_centavos_series(col: pd.Series) -> pd.Series:
+    """Versión vectorizada de parse_decimal_ar para una columna entera, en centavos (int64).
+       Cada monto distinto se parsea una sola vez. Vacío, None y NaN -> 0.
+       Camino rápido, en bloque: limpieza AR con un solo str.translate sobre todos los textos,
+       pd.to_numeric y c = rint(v * 100). Se acepta c solo si c / 100 == v: dentro de
+       DECIMAL(15,2) el ulp de v es < 0,002, así que el texto de origen (o el str() del número
+       del Excel) está a menos de medio centavo de c / 100 y redondearlo a 2 decimales mitad
+       hacia afuera da exactamente c, sin que el float decida nada. Lo demás (más de 2
+       decimales, fuera de rango, basura) cae al parser exacto de a un valor.
+    """
+    col = pd.Series(col)
+    if pd.api.types.is_integer_dtype(col):
+        out = col.to_numpy(dtype="int64") * 100
+        if len(out) and np.abs(out).max() > MAX_CENTAVOS:
+            raise ValueError(f"Monto fuera de rango para DECIMAL(15,2) en la columna {col.name}")
+        return pd.Series(out, index=col.index, dtype="int64")
+
+    numerica = pd.api.types.is_float_dtype(col)
+    codes, unicos = pd.factorize(col.to_numpy() if numerica else col.to_numpy(dtype=object))  # None/NaN -> -1
+    cent = np.zeros(len(unicos), dtype="int64")
+    vacio = np.zeros(len(unicos), dtype=bool)
+    if numerica:
+        v = unicos.astype("float64")
+    elif len(unicos):
+        es_txt = np.array([type(u) is str for u in unicos], dtype=bool)
+        valores = unicos.astype(object)
+        # Números del Excel al camino rápido; bool (str(True) no es un monto) y el resto, al exacto
+        for i in np.flatnonzero(~es_txt):
+            t = type(unicos[i])
+            if not (t is int or t is float or issubclass(t, (np.integer, np.floating))):
+                valores[i] = None
+        if es_txt.any():
+            limpios = clean_ar_money(unicos[es_txt].tolist())
+            valores[es_txt] = limpios
+            vacio[es_txt] = [t == "" for t in limpios]
+        v = pd.to_numeric(pd.Series(valores, dtype=object), errors="coerce").to_numpy(dtype="float64")
+
+    if len(unicos):
+        with np.errstate(invalid="ignore", over="ignore"):
+            c = np.rint(v * 100)
+            rapido = np.isfinite(c) & (np.abs(c) <= MAX_CENTAVOS) & (c / 100 == v)
+        cent[rapido] = c[rapido].astype("int64")
+
+        for i in np.flatnonzero(~rapido & ~vacio):
+            crudo = unicos[i]
+            # AR: sin puntos de miles ni espacios, coma -> punto (los str() de números ya vienen con punto)
+            s = AR_MONEY_RE.sub("", crudo).replace(",", ".") if isinstance(crudo, str) else str(crudo)
+            centavos = _plano_a_centavos(s)
+            if centavos is None and s:
+                try:
+                    centavos = decimal_to_centavos(Decimal(s))
+                except InvalidOperation:
+                    centavos = 0
+            cent[i] = centavos or 0
+
+    return pd.Series(np.where(codes >= 0, cent[codes] if len(cent) else 0, 0), index=col.index, dtype="int64")
+
+def format_centavos(serie: pd.Series) -> pd.Series:
+    """Centavos (int64) -> texto decimal exacto ('-1234.50'), vectorizado. Es lo que viaja a la
+       BD: MySQL lo convierte a DECIMAL sin pasar por float, y SQLite lo acepta igual (sqlite3
+       no sabe bindear Decimal). Mismo texto que '{:.2f}' del float equivalente."""
+    v = serie.to_numpy(dtype="int64")
+    a = np.abs(v)
+    txt = (pd.Series(a // 100, index=serie.index).astype(str) + "."
+           + pd.Series(a % 100, index=serie.index).astype(str).str.zfill(2))
+    return txt.where(v >= 0, "-" + txt)
+
 def parse_date_dmy(value):
     # Maneja None, NaN y NaT
     if value is None or (hasattr(pd, "isna") and pd.isna(value)):
@@ -89,61 +223,83 @@ def parse_date_dmy(value):
     dt = pd.to_datetime(s, dayfirst=True, errors="coerce")
     return None if pd.isna(dt) else dt.date()
 
-def normalize_header_text(s: str) -> str:
-    import unicodedata
-    s = str(s).strip().lower()
-    s = "".join(ch for ch in unicodedata.normalize("NFD", s) if unicodedata.category(ch) != "Mn")
-    s = re.sub(r"\s+", " ", s)
-    return s
-
-def normalize_categoria_raw(cat: str) -> str:
-    """Normaliza categorías.
-       - 'IMPUESTOS, IMPUESTOS' -> 'IMPUESTOS'
-       - Dedup case-insensitive preservando orden si hay múltiples separadas por coma.
+# Formatos que se prueban por columna (en orden). El último no está en parse_date_dmy
+# como strptime, pero es lo que su fallback dayfirst termina resolviendo.
+DATE_COLUMN_FORMATS = ("ISO8601", "%d/%m/%Y", "%d-%m-%Y", "%d/%m/%Y %H:%M:%S")
+
+def detect_date_format(muestra: str, candidatos=DATE_COLUMN_FORMATS):
+    """Devuelve el primer formato de 'candidatos' que parsea 'muestra' (o None)."""
+    for fmt in candidatos:
+        if fmt == "ISO8601":
+            if ISO_DT.match(muestra):
+                return fmt
+            continue
+        try:
+            datetime.strptime(muestra, fmt)
+            return fmt
+        except ValueError:
+            pass
+    return None
+
+def parse_date_series(col: pd.Series) -> pd.Series:
+    """Versión vectorizada de parse_date_dmy para una columna entera (mismo resultado:
+       datetime.date o None por celda). Cada fecha distinta se parsea una sola vez:
+       se detecta el formato de la columna, se convierte en bloque con ese formato
+       y solo lo que no entra pasa por parse_date_dmy.
     """
-    if not isinstance(cat, str):
-        return ""
-    x = cat.strip()
-    parts = [p.strip() for p in x.split(",") if p.strip() != ""]
-    if not parts:
-        return ""
-    lowered = [p.lower() for p in parts]
-    if len(set(lowered)) == 1:
-        return parts[0]
-    seen = set()
-    uniq = []
-    for p in parts:
-        key = p.lower()
-        if key not in seen:
-            seen.add(key)
-            uniq.append(p)
-    return ", ".join(uniq)
-
-def normalize_comprobante_value(x):
-    """Normaliza Nº de comprobante para evitar duplicados por pequeñas variaciones."""
-    if x is None:
-        return None
-    try:
-        if pd.isna(x):
-            return None
-    except Exception:
-        pass
-    s = str(x).strip()
-    if not s:
-        return None
-    # quitar espacios internos y extremos, mantener guiones/barra, usar mayúsculas
-    s = re.sub(r"\s+", "", s)
-    return s.upper()
+    col = pd.Series(col)
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col.dt.date.astype(object).where(col.notna(), None)
 
-def noneify(x):
-    """Convierte NaN/NaT a None para que PyMySQL no explote."""
-    try:
-        if x is None or pd.isna(x):
-            return None
-    except Exception:
-        if x is None:
-            return None
-    return x
+    vals = col.to_numpy(dtype=object)
+    out = np.full(len(vals), None, dtype=object)
+    txt = strip_text_cells(vals)             # NaN/None para lo que no es str
+    es_txt = txt.notna().to_numpy()
+
+    # Celdas no-texto (Timestamp/datetime que ya parseó el Excel, números sueltos)
+    otros = ~es_txt & pd.notna(vals)
+    if otros.any():
+        cache = {}
+        for i in np.flatnonzero(otros):
+            v = vals[i]
+            if v not in cache:
+                cache[v] = parse_date_dmy(v)
+            out[i] = cache[v]
+
+    if es_txt.any():
+        codes, unicos = pd.factorize(txt[es_txt])
+        crudo = pd.Series(unicos, dtype=object)
+        res = np.full(len(crudo), None, dtype=object)
+        pendientes = np.ones(len(crudo), dtype=bool)
+        candidatos = list(DATE_COLUMN_FORMATS)
+        # Una pasada por formato detectado; una columna mixta detecta el siguiente con lo que sobra
+        while pendientes.any() and candidatos:
+            fmt = detect_date_format(crudo[pendientes].iloc[0], candidatos)
+            if fmt is None:
+                break
+            candidatos.remove(fmt)
+            sub = crudo[pendientes]
+            dt = pd.to_datetime(sub, format=fmt, errors="coerce")
+            ok = dt.notna()
+            if fmt == "ISO8601":
+                ok &= sub.str.match(ISO_DT)
+            idx = np.flatnonzero(pendientes)[ok.to_numpy()]
+            res[idx] = dt[ok].dt.date.to_numpy(dtype=object)
+            pendientes[idx] = False
+        for i in np.flatnonzero(pendientes):
+            res[i] = parse_date_dmy(crudo.iat[i])
+        out[es_txt] = res[codes]
+
+    return pd.Series(out, index=col.index, dtype=object)
+
+def columns_to_native(df: pd.DataFrame, cols) -> dict:
+    """Columnas del DataFrame como listas nativas, con NaN/NaT -> None una sola vez por
+       columna, para que PyMySQL no explote."""
+    out = {}
+    for c in cols:
+        serie = df[c]
+        out[c] = serie.astype(object).where(serie.notna(), None).tolist()
+    return out
 
 COLMAP_EXPECTED = {
     # Excel -> nombre usado internamente
@@ -167,6 +323,12 @@ COLMAP_EXPECTED = {
     "fecha anula": "fechaAnula",
 }
 REQUIRED_NORMALIZED = {"tipo comprobante", "comprobante", "fecha", "total"}
+# Columnas (y orden) del DataFrame que devuelve map_dataframe
+MAPPED_COLS = ["tipoComprobante", "comprobante", "fecha", "fechaImputacion", "proveedorNombre",
+               "categoriaNombre", "detalles", "total", "montoPagado", "saldo", "estadoFacturacion",
+               "personal", "fechaVencimiento", "fechaRegistro", "observaciones", "personalAnula", "fechaAnula"]
+# Columnas con pocos valores distintos y muchas repeticiones: van como category
+CATEGORY_COLS = ["tipoComprobante", "proveedorNombre", "categoriaNombre", "estadoFacturacion"]
 
 CREATE_TABLES_SQL = """
 CREATE TABLE IF NOT EXISTS CategoriasServicios (
@@ -208,6 +370,7 @@ CREATE TABLE IF NOT EXISTS ComprobantesServicios (
   observaciones TEXT NULL,
   personalAnula VARCHAR(255) NULL,
   fechaAnula DATE NULL,
+  hashContenido CHAR(32) NULL,
   createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
   updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
   deletedAt DATETIME NULL,
@@ -217,101 +380,213 @@ CREATE TABLE IF NOT EXISTS ComprobantesServicios (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 """
 
+def _index_exists(conn, table, index_name):
+    return get_dialect(conn).index_exists(conn, table, index_name)
+
+def _column_exists(conn, table, column):
+    return get_dialect(conn).column_exists(conn, table, column)
+
+def _execute_ddl(conn, sql):
+    # DDL escrito para MySQL; en otros motores sale traducido (ver dialectos_db.py)
+    for stmt in get_dialect(conn).ddl(sql):
+        conn.execute(text(stmt))
+
+def _schema_tablas(conn):
+    # Crear tablas si faltan
+    for stmt in CREATE_TABLES_SQL.split(";"):
+        if stmt.strip():
+            _execute_ddl(conn, stmt)
+
+def _crear_unique_numero(conn) -> bool:
+    """Crea la UNIQUE por comprobante (anti-duplicado duro) si no hay duplicados que la
+       bloqueen. True si quedó creada (o ya estaba)."""
+    if _index_exists(conn, "ComprobantesServicios", "uq_comprobantes_numero"):
+        return True
+    dup = conn.execute(text("""
+        SELECT comprobante, COUNT(*) c
+        FROM ComprobantesServicios
+        WHERE comprobante IS NOT NULL AND comprobante <> ''
+        GROUP BY comprobante
+        HAVING c > 1
+        LIMIT 1
+    """)).fetchone()
+    if dup:
+        return False
+    try:
+        _execute_ddl(conn, "ALTER TABLE ComprobantesServicios ADD UNIQUE KEY uq_comprobantes_numero (comprobante)")
+        return True
+    except Exception:
+        # si falla por versión/permiso, lo ignoramos (DF dedupe igual)
+        return False
+
+def _schema_indice_numero(conn):
+    # ===== Índice por comprobante: la UNIQUE si se puede, si no uno simple =====
+    # El importador busca hashes por comprobante. Si la UNIQUE no se pudo crear, la
+    # reintenta el paso 005_unique_numero (este queda marcado con el índice simple).
+    if _crear_unique_numero(conn):
+        return
+    if not _index_exists(conn, "ComprobantesServicios", "idx_comprobantes_numero"):
+        conn.execute(text("CREATE INDEX idx_comprobantes_numero ON ComprobantesServicios (comprobante)"))
+
+def _schema_unique_numero(conn):
+    # ===== UNIQUE por comprobante, reintentada hasta que exista =====
+    # Mientras haya duplicados devuelve False y el paso queda pendiente: cada corrida repite
+    # el chequeo (una búsqueda del índice y el GROUP BY sobre idx_comprobantes_numero) y la
+    # crea apenas se limpien. También cubre bases donde 002 quedó marcado sin la UNIQUE.
+    return _crear_unique_numero(conn)
+
+def _schema_hash_contenido(conn):
+    # ===== Hash de contenido por fila (para no reescribir comprobantes sin cambios) =====
+    if not _column_exists(conn, "ComprobantesServicios", "hashContenido"):
+        conn.execute(text("ALTER TABLE ComprobantesServicios ADD COLUMN hashContenido CHAR(32) NULL"))
+
+LEDGER_TABLE = "ImportacionesArchivos"
+IMPORTADOR_NOMBRE = "comprobantes_servicios"
+
+def _schema_ledger(conn):
+    # ===== Ledger de archivos importados (para saltear exports idénticos) =====
+    _execute_ddl(conn, f"""
+    CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+      id BIGINT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
+      importador VARCHAR(100) NOT NULL,
+      archivo VARCHAR(255) NOT NULL,
+      sha256 CHAR(64) NOT NULL,
+      filas INT NULL,
+      fechaDesde DATE NULL,
+      fechaHasta DATE NULL,
+      resultado VARCHAR(20) NOT NULL,
+      detalle TEXT NULL,
+      createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      KEY idx_importaciones_sha (importador, sha256, resultado)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+# Pasos de DDL del importador, en orden. Nunca renombrar uno ya publicado: agregar al final.
+SCHEMA_STEPS = [
+    ("comprobantes/001_tablas", _schema_tablas),
+    ("comprobantes/002_indice_numero", _schema_indice_numero),
+    ("comprobantes/003_hash_contenido", _schema_hash_contenido),
+    ("comprobantes/004_ledger", _schema_ledger),
+    ("comprobantes/005_unique_numero", _schema_unique_numero),
+]
+
 def ensure_schema(engine: Engine):
-    def table_exists(conn, name):
-        row = conn.execute(
-            text("SELECT 1 FROM information_schema.tables WHERE table_schema=:db AND table_name=:t LIMIT 1"),
-            {"db": DB_NAME, "t": name}
-        ).fetchone()
-        return bool(row)
-
-    def index_exists(conn, table, index_name):
-        row = conn.execute(
-            text("""SELECT 1
-                    FROM information_schema.statistics
-                    WHERE table_schema=:db AND table_name=:t AND index_name=:i
-                    LIMIT 1"""),
-            {"db": DB_NAME, "t": table, "i": index_name}
+    """Aplica los pasos de SCHEMA_STEPS que falten. Con todo aplicado es una sola consulta
+       a ImportadoresSchema (sin information_schema ni el escaneo de duplicados); solo
+       mientras haya comprobantes duplicados se repite el chequeo de la UNIQUE."""
+    aplicados = run_schema_steps(engine, SCHEMA_STEPS)
+    if aplicados:
+        print(f"  • schema: aplicados {', '.join(aplicados)}")
+
+# ========= Ledger de importaciones =========
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def find_successful_import(engine: Engine, sha256: str):
+    """Última importación OK de un archivo con este sha256 (fila del ledger) o None."""
+    with engine.connect() as conn:
+        return conn.execute(
+            text(f"""SELECT createdAt, archivo, filas FROM {LEDGER_TABLE}
+                     WHERE importador=:imp AND sha256=:sha AND resultado='OK'
+                     ORDER BY id DESC LIMIT 1"""),
+            {"imp": IMPORTADOR_NOMBRE, "sha": sha256}
         ).fetchone()
-        return bool(row)
 
+def record_import(engine: Engine, path: Path, sha256: str, resultado: str, filas=None,
+                  fecha_desde=None, fecha_hasta=None, detalle=None):
     with engine.begin() as conn:
-        # Crear tablas si faltan
-        if not table_exists(conn, "CategoriasServicios"):
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS CategoriasServicios (
-              id BIGINT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
-              nombre VARCHAR(255) NOT NULL,
-              descripcion VARCHAR(500) NULL,
-              createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-              updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-              deletedAt DATETIME NULL,
-              UNIQUE KEY uq_categoriasservicios_nombre (nombre)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """))
-        if not table_exists(conn, "ProveedoresServicios"):
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS ProveedoresServicios (
-              id BIGINT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
-              nombre VARCHAR(255) NOT NULL,
-              razonSocial VARCHAR(255) NULL,
-              createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-              updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-              deletedAt DATETIME NULL,
-              UNIQUE KEY uq_proveedoresservicios_nombre (nombre)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """))
-        if not table_exists(conn, "ComprobantesServicios"):
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS ComprobantesServicios (
-              id BIGINT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
-              tipoComprobante VARCHAR(100) NOT NULL,
-              comprobante VARCHAR(100) NOT NULL,
-              fecha DATE NOT NULL,
-              fechaImputacion DATE NULL,
-              proveedorId BIGINT UNSIGNED NULL,
-              categoriaId BIGINT UNSIGNED NULL,
-              detalles VARCHAR(500) NULL,
-              total DECIMAL(15,2) NOT NULL DEFAULT 0,
-              montoPagado DECIMAL(15,2) NOT NULL DEFAULT 0,
-              saldo DECIMAL(15,2) NOT NULL DEFAULT 0,
-              estadoFacturacion VARCHAR(100) NOT NULL DEFAULT 'EMITIDA',
-              personal VARCHAR(255) NULL,
-              fechaVencimiento DATE NULL,
-              fechaRegistro DATE NULL,
-              observaciones TEXT NULL,
-              personalAnula VARCHAR(255) NULL,
-              fechaAnula DATE NULL,
-              createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-              updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-              deletedAt DATETIME NULL,
-              CONSTRAINT fk_comprobantes_proveedor FOREIGN KEY (proveedorId) REFERENCES ProveedoresServicios(id),
-              CONSTRAINT fk_comprobantes_categoria FOREIGN KEY (categoriaId) REFERENCES CategoriasServicios(id),
-              UNIQUE KEY uq_comprobantes_nat (tipoComprobante, comprobante, fecha)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """))
-
-        # ===== Índice UNIQUE extra por comprobante (anti-duplicado duro) =====
-        # Si ya existen duplicados, no lo creamos para no romper; igual el importador dedupea en DF.
-        dup = conn.execute(text("""
-            SELECT comprobante, COUNT(*) c
-            FROM ComprobantesServicios
-            WHERE comprobante IS NOT NULL AND comprobante <> ''
-            GROUP BY comprobante
-            HAVING c > 1
-            LIMIT 1
-        """)).fetchone()
-        if not dup and not index_exists(conn, "ComprobantesServicios", "uq_comprobantes_numero"):
-            try:
-                conn.execute(text("ALTER TABLE ComprobantesServicios ADD UNIQUE KEY uq_comprobantes_numero (comprobante)"))
-            except Exception:
-                # si falla por versión/permiso, lo ignoramos (DF dedupe igual)
-                pass
+        conn.execute(
+            text(f"""INSERT INTO {LEDGER_TABLE}
+                     (importador, archivo, sha256, filas, fechaDesde, fechaHasta, resultado, detalle)
+                     VALUES (:imp, :arch, :sha, :filas, :desde, :hasta, :res, :det)"""),
+            {"imp": IMPORTADOR_NOMBRE, "arch": path.name[:255], "sha": sha256, "filas": filas,
+             "desde": fecha_desde, "hasta": fecha_hasta, "res": resultado, "det": detalle},
+        )
+
+# Strings que pd.read_excel toma como NaN por defecto (para que el lector streaming dé lo mismo)
+EXCEL_NA_STRINGS = frozenset(["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+                              "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None",
+                              "n/a", "nan", "null"])
+
+def _excel_number(v):
+    # Igual que pandas: Excel guarda todo número como float; los enteros vuelven como int
+    if isinstance(v, float) and math.isfinite(v) and int(v) == v:
+        return int(v)
+    return v
 
-def read_excel_raw(path: Path) -> pd.DataFrame:
+def iter_excel_rows(path: Path):
+    """Filas crudas (listas) de la primera hoja, una por vez, con la misma conversión de
+       celdas que pd.read_excel. .xlsx: openpyxl read-only (no carga la hoja entera).
+       .xls: xlrd con on_demand (BIFF no es streameable: xlrd carga la hoja, pero nunca
+       se arma un DataFrame completo)."""
     ext = path.suffix.lower()
-    engine_name = "xlrd" if ext == ".xls" else "openpyxl"
-    return pd.read_excel(path, header=None, engine=engine_name)
+    if ext == ".xls":
+        import xlrd
+        from xlrd import XL_CELL_BOOLEAN, XL_CELL_DATE, XL_CELL_ERROR, XL_CELL_NUMBER, xldate
+        from datetime import time as dtime
+
+        book = xlrd.open_workbook(str(path), on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            epoch1904 = book.datemode
+
+            def parse_cell(v, typ):
+                if typ == XL_CELL_DATE:
+                    try:
+                        v = xldate.xldate_as_datetime(v, epoch1904)
+                    except OverflowError:
+                        return v
+                    if v.timetuple()[0:3] == ((1904, 1, 1) if epoch1904 else (1899, 12, 31)):
+                        v = dtime(v.hour, v.minute, v.second, v.microsecond)
+                    return v
+                if typ == XL_CELL_ERROR:
+                    return np.nan
+                if typ == XL_CELL_BOOLEAN:
+                    return bool(v)
+                if typ == XL_CELL_NUMBER:
+                    return _excel_number(v)
+                return v
+
+            for i in range(sheet.nrows):
+                yield [parse_cell(v, t) for v, t in zip(sheet.row_values(i), sheet.row_types(i))]
+            book.unload_sheet(0)
+        finally:
+            book.release_resources()
+    else:
+        from openpyxl import load_workbook
+        from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0]
+            ws.reset_dimensions()
+            for row in ws.rows:
+                out = []
+                for cell in row:
+                    v = cell.value
+                    if v is None:
+                        v = ""
+                    elif cell.data_type == TYPE_ERROR:
+                        v = np.nan
+                    elif cell.data_type == TYPE_NUMERIC:
+                        v = _excel_number(float(v)) if not isinstance(v, int) else v
+                    out.append(v)
+                yield out
+        finally:
+            wb.close()
+
+def rows_to_frame(rows, columns=None, start: int = 0) -> pd.DataFrame:
+    """Filas crudas -> DataFrame, con los mismos NaN que pondría pd.read_excel. El índice
+       arranca en 'start' (posición de la primera fila entre las de datos del archivo)."""
+    width = len(columns) if columns is not None else max((len(r) for r in rows), default=0)
+    data = [(list(r[:width]) + [np.nan] * (width - len(r))) for r in rows]
+    df = pd.DataFrame(data, columns=columns, dtype=object, index=pd.RangeIndex(start, start + len(data)))
+    df = df.mask(df.isin(EXCEL_NA_STRINGS))
+    return df.infer_objects()
 
 def find_header_row(df_raw: pd.DataFrame, scan_rows: int = 25) -> int:
     """
@@ -327,26 +602,404 @@ def find_header_row(df_raw: pd.DataFrame, scan_rows: int = 25) -> int:
             return i
     return -1
 
-def load_excel(path: Path) -> pd.DataFrame:
-    df_raw = read_excel_raw(path)
-    header_idx = find_header_row(df_raw)
+def iter_excel_chunks(path: Path, chunk_rows: int = 5000, scan_rows: int = 25):
+    """
+    Lector streaming: mira solo las primeras 'scan_rows' filas para encontrar el encabezado
+    (si no aparece, usa la primera fila, como el fallback de siempre) y después devuelve el
+    resto como DataFrames de a 'chunk_rows' filas. La memoria queda acotada por chunk_rows.
+    El índice de cada chunk sigue la numeración de las filas de datos del archivo (0, 1, ...).
+    """
+    rows = iter_excel_rows(path)
+    head = []
+    for r in rows:
+        head.append(r)
+        if len(head) >= scan_rows:
+            break
+    if not head:
+        return
+    header_idx = find_header_row(rows_to_frame(head), scan_rows=scan_rows)
     if header_idx == -1:
-        # fallback: intentar con encabezado en la primera fila
+        header_idx = 0
+    headers = rows_to_frame([head[header_idx]]).iloc[0].tolist()
+
+    pending = head[header_idx + 1:]
+    start = 0
+    for r in rows:
+        pending.append(r)
+        if len(pending) >= chunk_rows:
+            yield rows_to_frame(pending, columns=headers, start=start)
+            start += len(pending)
+            pending = []
+    if pending:
+        yield rows_to_frame(pending, columns=headers, start=start)
+
+def fecha_sort_key(fechas: pd.Series) -> np.ndarray:
+    """Clave de orden (int64) de una columna de fechas mapeada para el dedupe por
+       `comprobante`: días desde epoch, y sin fecha cuenta como la más reciente."""
+    dias = fechas.to_numpy(dtype=object).astype("datetime64[D]")
+    return np.where(np.isnat(dias), np.iinfo("int64").max, dias.astype("int64"))
+
+def latest_positions(claves_por_chunk) -> dict:
+    """
+    {comprobante: posición de la fila que gana} sobre el archivo entero, con la regla de
+    dedupe de map_dataframe (gana la fecha más reciente, a igual fecha la que aparece después,
+    sin fecha cuenta como la más reciente). Recibe, chunk por chunk, DataFrames con
+    `comprobante` y `fecha` ya mapeados e indexados por posición: los de map_keys (pasada de
+    claves de .xlsx) o los chunks de map_dataframe (.xls). La memoria es una entrada por clave.
+    """
+    orden = {}
+    ganadores = {}
+    for claves in claves_por_chunk:
+        clave = pd.Series(fecha_sort_key(claves["fecha"]), index=claves.index)
+        # dentro del chunk: la última posición con la fecha más alta
+        mejor = clave.iloc[np.argsort(clave.to_numpy(), kind="stable")]
+        comps = claves["comprobante"].loc[mejor.index]
+        ultimo = ~comps.duplicated(keep="last")
+        mejor, comps = mejor[ultimo.to_numpy()], comps[ultimo.to_numpy()]
+        # contra los chunks anteriores: a igual fecha gana este (viene después)
+        previa = comps.map(orden)
+        gana = (previa.isna() | (mejor >= previa)).to_numpy()
+        orden.update(zip(comps[gana], mejor[gana].tolist()))
+        ganadores.update(zip(comps[gana], mejor.index[gana].tolist()))
+    return ganadores
+
+def keep_latest(dfm: pd.DataFrame, ganadores: dict) -> pd.DataFrame:
+    """Filas de un chunk mapeado que son la ganadora de su `comprobante` (ver latest_positions)."""
+    return dfm[dfm["comprobante"].map(ganadores).to_numpy() == dfm.index.to_numpy()]
+
+class StageTimer:
+    """
+    Segundos por etapa de iter_mapped_chunks, sumados en el dict 'tiempos' (lo usa
+    bench_importadores para medir el iterador de producción). Los tiempos son exclusivos:
+    si una etapa corre dentro de otra (la lectura de la pasada de claves), lo suyo no se
+    cuenta en la de afuera, así que la suma de las etapas es el tiempo total. Sin 'tiempos'
+    no mide nada.
+    """
+
+    def __init__(self, tiempos: dict = None):
+        self.tiempos = tiempos
+        self._hijos = []  # por nivel abierto: segundos ya contados en etapas internas
+
+    @contextmanager
+    def __call__(self, etapa: str):
+        if self.tiempos is None:
+            yield
+            return
+        self._hijos.append(0.0)
+        t0 = time.perf_counter()
         try:
-            ext = path.suffix.lower()
-            engine_name = "xlrd" if ext == ".xls" else "openpyxl"
-            return pd.read_excel(path, engine=engine_name)
-        except Exception:
-            df = df_raw.copy()
-            df.columns = df.iloc[0].tolist()
-            df = df.iloc[1:].reset_index(drop=True)
-            return df
-    headers = df_raw.iloc[header_idx].tolist()
-    df = df_raw.iloc[header_idx + 1:].reset_index(drop=True).copy()
-    df.columns = headers
-    return df
+            yield
+        finally:
+            seg = time.perf_counter() - t0
+            propio = seg - self._hijos.pop()
+            self.tiempos[etapa] = self.tiempos.get(etapa, 0.0) + propio
+            if self._hijos:
+                self._hijos[-1] += seg
 
-def map_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    def iter(self, iterable, etapa: str):
+        """Itera 'iterable' contando cada next() en 'etapa'."""
+        it = iter(iterable)
+        while True:
+            with self(etapa):
+                item = next(it, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+def iter_mapped_chunks(path: Path, chunk_rows: int = 5000, tiempos: dict = None):
+    """
+    (filas leídas, DataFrame mapeado y dedupeado) por cada chunk del Excel, en orden.
+    Cada chunk se escribe antes de leer el siguiente, así que la fila que gana cada
+    `comprobante` tiene que estar decidida antes de empezar. Si el archivo entra en un chunk,
+    map_dataframe ya deja una fila por comprobante. Si ocupa más:
+      - .xlsx: se lee dos veces, la primera solo para las claves (map_keys): la memoria
+        queda acotada por chunk_rows.
+      - .xls: xlrd carga la hoja entera igual (ver iter_excel_rows), así que una segunda
+        lectura no ahorra memoria: se mapean todos los chunks, se decide sobre ellos y
+        se entregan de a uno.
+    'tiempos' (opcional): dict donde se suman los segundos de lectura (Excel -> chunk crudo,
+    en las dos pasadas), claves (map_keys + latest_positions) y mapeo (map_dataframe +
+    keep_latest). Ver StageTimer.
+    """
+    medir = StageTimer(tiempos)
+    chunks = medir.iter(iter_excel_chunks(path, chunk_rows=chunk_rows), "lectura")
+    primeros = list(islice(chunks, 2))
+    if len(primeros) < 2:
+        for chunk in primeros:
+            with medir("mapeo"):
+                dfm = map_dataframe(chunk)
+            yield len(chunk), dfm
+        return
+    if path.suffix.lower() == ".xls":
+        mapeados = []
+        for chunk in chain(primeros, chunks):
+            with medir("mapeo"):
+                mapeados.append((len(chunk), map_dataframe(chunk)))
+        del primeros
+        with medir("claves"):
+            ganadores = latest_positions(dfm for _, dfm in mapeados)
+        for leidas, dfm in mapeados:
+            with medir("mapeo"):
+                dfm = keep_latest(dfm, ganadores)
+            yield leidas, dfm
+        return
+    with medir("claves"):
+        ganadores = latest_positions(map_keys(chunk) for chunk in chain(primeros, chunks))
+    del primeros
+    for chunk in medir.iter(iter_excel_chunks(path, chunk_rows=chunk_rows), "lectura"):
+        with medir("mapeo"):
+            dfm = keep_latest(map_dataframe(chunk), ganadores)
+        yield len(chunk), dfm
+
+# ========= Varios archivos =========
+EXCEL_SUFFIXES = (".xls", ".xlsx")
+
+def expand_inputs(rutas) -> list:
+    """Archivos a importar, en el orden dado; los directorios aportan sus .xls/.xlsx ordenados
+       por nombre (sin los temporales '~$' de Excel). Sin repetidos."""
+    paths = []
+    for ruta in map(Path, rutas):
+        if ruta.is_dir():
+            paths.extend(sorted(p for p in ruta.iterdir()
+                                if p.suffix.lower() in EXCEL_SUFFIXES and not p.name.startswith("~$")))
+        else:
+            paths.append(ruta)
+    return list(dict.fromkeys(paths))
+
+def parse_file(path: Path, chunk_rows: int = 5000):
+    """(path, filas leídas, DataFrame mapeado y dedupeado o None si no tenía filas) de un
+       archivo entero. Corre en los procesos del pool de parse_files: no toca la BD."""
+    leidas = 0
+    frames = []
+    # el archivo entero queda en memoria igual: se dedupea al final, sin la pasada de claves
+    for chunk in iter_excel_chunks(path, chunk_rows=chunk_rows):
+        leidas += len(chunk)
+        frames.append(map_dataframe(chunk))
+    if not frames:
+        return path, leidas, None
+    return path, leidas, dedupe_latest(frames)
+
+def parse_files(paths, chunk_rows: int = 5000, procesos: int = None):
+    """parse_file de cada archivo en un pool de procesos; resultados en el orden de 'paths'."""
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    procesos = max(1, min(procesos or os.cpu_count() or 1, len(paths)))
+    # spawn: los workers no heredan el engine ni sus conexiones abiertas
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=get_context("spawn")) as pool:
+        yield from pool.map(parse_file, paths, [chunk_rows] * len(paths))
+
+def dedupe_latest(frames) -> pd.DataFrame:
+    """Une DataFrames mapeados (chunks de un archivo o archivos enteros) y deja una fila por
+       `comprobante` con la regla de map_dataframe (None = archivo vacío, se ignora): gana la
+       fecha más reciente, a igual fecha la que aparece después (posterior en 'frames'), y sin
+       fecha cuenta como la más reciente. Sin ningún frame (todos los archivos vacíos) devuelve
+       un DataFrame vacío con las columnas de map_dataframe, como el camino de un solo archivo."""
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return pd.DataFrame(columns=MAPPED_COLS)
+    df = pd.concat(frames, ignore_index=True)
+    df = df.iloc[np.argsort(fecha_sort_key(df["fecha"]), kind="stable")].drop_duplicates(subset=["comprobante"], keep="last")
+    # concat de categorías distintas vuelve a object
+    return a_categorias(df.reset_index(drop=True), CATEGORY_COLS)
+
+def prefetch(iterable, maxsize: int = 2):
+    """
+    Consume 'iterable' en un thread productor y entrega sus items por una cola acotada
+    (backpressure: el productor espera si hay 'maxsize' items sin consumir). Un solo
+    productor y un solo consumidor: el orden se mantiene. Los errores del productor se
+    re-lanzan en el consumidor; si el consumidor corta, el productor se detiene.
+    """
+    import queue
+    import threading
+
+    q = queue.Queue(maxsize=maxsize)
+    fin = object()
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producir():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((fin, None))
+        except BaseException as e:
+            put((fin, e))
+
+    th = threading.Thread(target=producir, name="importador-productor", daemon=True)
+    th.start()
+    try:
+        while True:
+            item, err = q.get()
+            if item is fin:
+                if err is not None:
+                    raise err
+                return
+            yield item
+    finally:
+        stop.set()
+        th.join(timeout=5)
+
+def resolve_lookup_ids(conn, table: str, nombres) -> dict:
+    """Resuelve {nombre: id} en una tabla de lookup (ProveedoresServicios / CategoriasServicios)
+       de forma set-based: precarga la tabla, crea todos los faltantes con un único
+       INSERT IGNORE multi-fila y relee sus IDs con un solo SELECT ... IN.
+       'nombres' va en el orden del archivo: si varios nombres nuevos comparten lookup_key
+       ('Edesur', 'EDESUR'), se crea el primero que aparece.
+    """
+    nombres = list(dict.fromkeys(n for n in nombres if n))
+    if not nombres:
+        return {}
+    by_key = {}
+    for row_id, nombre in conn.execute(text(f"SELECT id, nombre FROM {table} WHERE deletedAt IS NULL")):
+        by_key.setdefault(lookup_key(nombre), int(row_id))
+
+    nuevos = {}
+    for n in nombres:
+        if lookup_key(n) not in by_key:
+            nuevos.setdefault(lookup_key(n), n)
+    faltantes = sorted(nuevos.values())
+    if faltantes:
+        values = ", ".join(f"(:n{i})" for i in range(len(faltantes)))
+        conn.execute(text(f"{get_dialect(conn).insert_ignore(table)} (nombre) VALUES {values}"),
+                     {f"n{i}": n for i, n in enumerate(faltantes)})
+        # Sin filtrar deletedAt: un nombre dado de baja igual ocupa la UNIQUE y es su id
+        q = text(f"SELECT id, nombre FROM {table} WHERE nombre IN :ns").bindparams(bindparam("ns", expanding=True))
+        for row_id, nombre in conn.execute(q, {"ns": faltantes}):
+            by_key.setdefault(lookup_key(nombre), int(row_id))
+
+    return {n: by_key.get(lookup_key(n)) for n in nombres}
+
+# Columnas del INSERT en ComprobantesServicios (mismo orden que el statement)
+UPSERT_COLS = ["tipoComprobante", "comprobante", "fecha", "fechaImputacion", "proveedorId", "categoriaId",
+               "detalles", "total", "montoPagado", "saldo", "estadoFacturacion", "personal",
+               "fechaVencimiento", "fechaRegistro", "observaciones", "personalAnula", "fechaAnula",
+               "hashContenido"]
+# Columnas que pisa el ON DUPLICATE KEY UPDATE (la clave natural no se toca)
+UPDATE_COLS = [c for c in UPSERT_COLS if c not in ("tipoComprobante", "comprobante", "fecha")]
+
+# Modos de escritura de upsert_rows
+WRITE_MODES = ("multirow", "executemany", "staging")
+# Fracción de max_allowed_packet que puede ocupar un INSERT multi-fila, con techo fijo
+# para no armar transacciones gigantes que retengan locks mucho tiempo.
+PACKET_BUDGET_RATIO = 0.5
+MULTIROW_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_MAX_ALLOWED_PACKET = 4 * 1024 * 1024
+
+# Contenido de la fila mapeada que entra en el hash (nombres crudos, no IDs: depende solo del archivo)
+HASH_COLS = ["tipoComprobante", "comprobante", "fecha", "fechaImputacion", "proveedorNombre", "categoriaNombre",
+             "detalles", "total", "montoPagado", "saldo", "estadoFacturacion", "personal",
+             "fechaVencimiento", "fechaRegistro", "observaciones", "personalAnula", "fechaAnula"]
+
+def compute_row_hashes(df: pd.DataFrame) -> pd.Series:
+    """md5 (hex) estable por fila sobre HASH_COLS. Montos a 2 decimales (como DECIMAL(15,2)),
+       fechas ISO y NULL como \\N, así el mismo comprobante da el mismo hash en cada corrida."""
+
+    partes = []
+    for c in HASH_COLS:
+        serie = df[c]
+        if c in MONEY_COLS:
+            txt = format_centavos(serie)
+        else:
+            txt = serie.astype(str)
+        partes.append(txt.where(serie.notna(), "\\N"))
+    if not len(df):
+        return pd.Series([], index=df.index, dtype=object)
+    lineas = partes[0].str.cat(partes[1:], sep="\x1f")
+    return pd.Series([hashlib.md5(x.encode("utf-8")).hexdigest() for x in lineas], index=df.index, dtype=object)
+
+def fetch_stored_hashes(conn, comprobantes, table: str = "ComprobantesServicios", chunk: int = 1000) -> dict:
+    """{comprobante: {hashContenido, ...}} de lo que ya está en la tabla, en SELECT ... IN por tandas."""
+    q = (text(f"SELECT comprobante, hashContenido FROM {table} WHERE comprobante IN :cs")
+         .bindparams(bindparam("cs", expanding=True)))
+    claves = list(comprobantes)
+    stored = {}
+    for i in range(0, len(claves), chunk):
+        for comp, h in conn.execute(q, {"cs": claves[i:i + chunk]}):
+            stored.setdefault(comp, set()).add(h)
+    return stored
+
+def classify_rows(df: pd.DataFrame, stored: dict):
+    """Separa las filas en nuevas / cambiadas / sin cambios contra los hashes guardados.
+       Devuelve (df solo con nuevas + cambiadas, {"nuevas": n, "cambiadas": n, "sin_cambios": n})."""
+    existe = df["comprobante"].isin(stored.keys())
+    igual = pd.Series(
+        [h in stored.get(c, ()) for c, h in zip(df["comprobante"], df["hashContenido"])],
+        index=df.index, dtype=bool,
+    )
+    counts = {
+        "nuevas": int((~existe).sum()),
+        "cambiadas": int((existe & ~igual).sum()),
+        "sin_cambios": int(igual.sum()),
+    }
+    return df[~igual], counts
+
+def build_batch_rows(cols: dict, start: int, stop: int, prov_ids: dict, cat_ids: dict) -> list:
+    """Tuplas en el orden de UPSERT_COLS para las filas [start, stop), a partir de las
+       columnas nativas (ver columns_to_native) y de los mapas nombre -> id."""
+    datos = {k: cols[k][start:stop] for k in UPSERT_COLS if k in cols}
+    datos["proveedorId"] = [prov_ids.get(n) for n in cols["proveedorNombre"][start:stop]]
+    datos["categoriaId"] = [cat_ids.get(n) for n in cols["categoriaNombre"][start:stop]]
+    return list(zip(*(datos[k] for k in UPSERT_COLS)))
+
+def build_batch_params(cols: dict, start: int, stop: int, prov_ids: dict, cat_ids: dict) -> list:
+    """Lista de parámetros (dicts) del executemany para las filas [start, stop)."""
+    return [dict(zip(UPSERT_COLS, fila)) for fila in build_batch_rows(cols, start, stop, prov_ids, cat_ids)]
+
+def build_upsert_sql(table: str = "ComprobantesServicios", dialect=None) -> str:
+    """INSERT ... ON DUPLICATE KEY UPDATE (o el equivalente del dialecto) de una fila,
+       con parámetros nombrados (executemany)."""
+    return (
+        f"INSERT INTO {table} ({', '.join(UPSERT_COLS)}) "
+        f"VALUES ({', '.join(':' + c for c in UPSERT_COLS)}) "
+        f"{(dialect or MySQLDialect()).upsert_clause(UPDATE_COLS)}"
+    )
+
+def build_multirow_sql(n_rows: int, table: str = "ComprobantesServicios", placeholder: str = "%s",
+                       dialect=None) -> str:
+    """INSERT ... VALUES (...),(...) ON DUPLICATE KEY UPDATE (o el equivalente del dialecto)
+       para n_rows filas (parámetros posicionales)."""
+    fila = "(" + ", ".join([placeholder] * len(UPSERT_COLS)) + ")"
+    return (
+        f"INSERT INTO {table} ({', '.join(UPSERT_COLS)}) VALUES {', '.join([fila] * n_rows)} "
+        f"{(dialect or MySQLDialect()).upsert_clause(UPDATE_COLS)}"
+    )
+
+def get_statement_budget(conn) -> int:
+    """Bytes que puede ocupar un INSERT multi-fila según max_allowed_packet del server."""
+    packet = get_dialect(conn).max_statement_bytes(conn) or DEFAULT_MAX_ALLOWED_PACKET
+    return min(int(packet * PACKET_BUDGET_RATIO), MULTIROW_MAX_BYTES)
+
+def estimate_row_bytes(cols: dict) -> np.ndarray:
+    """Tamaño aproximado (bytes) de cada fila como literal SQL: texto en utf-8, ancho fijo
+       generoso para números/fechas/NULL, más comillas y coma por valor."""
+    n = len(cols["comprobante"])
+    total = np.full(n, 2 + 2 * 24, dtype="int64")  # paréntesis + proveedorId/categoriaId
+    for c in UPSERT_COLS:
+        if c not in cols:
+            continue
+        total += np.fromiter((len(v.encode("utf-8")) if isinstance(v, str) else 24 for v in cols[c]),
+                             dtype="int64", count=n) + 3
+    return total
+
+def max_stop_by_bytes(cum_bytes: np.ndarray, start: int, budget: int, overhead: int = 1024) -> int:
+    """Mayor 'stop' tal que las filas [start, stop) entren en 'budget' bytes (cum_bytes = cumsum
+       de estimate_row_bytes). Siempre incluye al menos una fila."""
+    base = cum_bytes[start - 1] if start else 0
+    stop = int(np.searchsorted(cum_bytes, base + budget - overhead, side="right"))
+    return max(stop, start + 1)
+
+def rename_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Encabezados normalizados y renombrados a los nombres de la BD; valida las requeridas."""
     df = df.copy()
     df.columns = [normalize_header_text(c) for c in df.columns]
 
@@ -359,40 +1012,59 @@ def map_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     faltantes = [c for c in required if c not in df.columns]
     if faltantes:
         raise RuntimeError(f"Faltan columnas requeridas en el Excel: {faltantes}\nColumnas disponibles: {list(df.columns)}")
+    return df
 
-    # Normalización de Nº de comprobante
-    df["comprobante"] = df["comprobante"].apply(normalize_comprobante_value)
-    # Filtrar vacíos
-    df = df[df["comprobante"].notna() & (df["comprobante"].astype(str).str.strip() != "")]
-    # Dedupe por comprobante (quedate con la última ocurrencia)
-    # Ordenamos por fecha para que 'keep=last' sea el más reciente
-    if "fecha" in df.columns:
-        df["_orden_fecha"] = df["fecha"].apply(lambda x: pd.to_datetime(x, dayfirst=True, errors="coerce"))
-        df = df.sort_values(by=["_orden_fecha"]).drop(columns=["_orden_fecha"])
-    df = df.drop_duplicates(subset=["comprobante"], keep="last")
+def drop_empty_comprobantes(df: pd.DataFrame) -> pd.DataFrame:
+    """Nº de comprobante normalizado, sin las filas que quedan sin número."""
+    df["comprobante"] = normalize_comprobante_series(df["comprobante"])
+    return df[df["comprobante"].notna() & (df["comprobante"].astype(str).str.strip() != "")].copy()
+
+def map_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """Solo `comprobante` y `fecha` de un chunk crudo, con las mismas filas y valores que
+       dejaría map_dataframe antes de su dedupe (para latest_positions)."""
+    df = drop_empty_comprobantes(rename_columns(df)[["comprobante", "fecha"]])
+    df["fecha"] = parse_date_series(df["fecha"])
+    return df
+
+def map_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    df = rename_columns(df)
+    a_categorias(df, CATEGORY_COLS)
+
+    # Normalización de Nº de comprobante y filtrado de vacíos
+    df = drop_empty_comprobantes(df)
 
-    # Fechas
+    # Fechas (una pasada vectorizada por columna)
     for col in ["fecha", "fechaImputacion", "fechaVencimiento", "fechaRegistro", "fechaAnula"]:
         if col in df.columns:
-            df[col] = df[col].apply(parse_date_dmy)
+            df[col] = parse_date_series(df[col])
 
-    # Montos
-    for col in ["total", "montoPagado", "saldo"]:
+    # Dedupe por comprobante (quedate con la última ocurrencia)
+    # Ordenamos por la fecha ya parseada para que 'keep=last' sea el más reciente
+    if "fecha" in df.columns:
+        df["_orden_fecha"] = df["fecha"].to_numpy(dtype=object).astype("datetime64[D]")
+        df = df.sort_values(by=["_orden_fecha"], kind="stable").drop(columns=["_orden_fecha"])
+    df = df.drop_duplicates(subset=["comprobante"], keep="last")
+
+    # Montos, en centavos (int64)
+    for col in MONEY_COLS:
         if col in df.columns:
-            df[col] = df[col].apply(parse_decimal_ar)
+            df[col] = parse_centavos_series(df[col])
         else:
-            df[col] = Decimal("0")
+            df[col] = np.zeros(len(df), dtype="int64")
 
     # Calcular saldo si falta
     if "saldo" in df.columns:
-        df["saldo"] = df.apply(lambda r: (r.get("total") or Decimal("0")) - (r.get("montoPagado") or Decimal("0")), axis=1)
+        df["saldo"] = df["total"] - df["montoPagado"]
 
     # Fallback de categoriaNombre si no viene: intentar desde "detalles"
     if "categoriaNombre" not in df.columns:
         df["categoriaNombre"] = None
     if "detalles" in df.columns:
         mask_empty_cat = df["categoriaNombre"].isna() & df["detalles"].notna()
-        df.loc[mask_empty_cat, "categoriaNombre"] = df.loc[mask_empty_cat, "detalles"].astype(str).apply(normalize_categoria_raw)
+        if mask_empty_cat.any():
+            desde_detalles = normalize_categoria_series(df.loc[mask_empty_cat, "detalles"].astype(str))
+            df["categoriaNombre"] = df["categoriaNombre"].astype(object).mask(mask_empty_cat, desde_detalles)
+    a_categorias(df, ["categoriaNombre"])
 
     # Completar columnas faltantes
     defaults = {
@@ -406,53 +1078,183 @@ def map_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     for k, v in defaults.items():
         if k not in df.columns:
             df[k] = v
+    a_categorias(df, ["estadoFacturacion", "proveedorNombre"])
 
-    final_cols = ["tipoComprobante","comprobante","fecha","fechaImputacion","proveedorNombre",
-                  "categoriaNombre","detalles","total","montoPagado","saldo","estadoFacturacion",
-                  "personal","fechaVencimiento","fechaRegistro","observaciones","personalAnula","fechaAnula"]
-    for c in final_cols:
+    for c in MAPPED_COLS:
         if c not in df.columns:
             df[c] = None
 
-    return df[final_cols]
+    return df[MAPPED_COLS]
 
 # ========= UPSERT masivo en lotes =========
-def upsert_rows(df: pd.DataFrame, engine: Engine, batch_size: int = 250, max_retries: int = 5):
+def try_in_tx(conn, fn) -> bool:
+    """Corre fn() en una transacción propia. Devuelve False (con rollback hecho) si MySQL
+       la abortó por lock wait timeout o deadlock (o su equivalente en el dialecto);
+       cualquier otro error se propaga."""
+    from sqlalchemy.exc import OperationalError
+
+    try:
+        with conn.begin():
+            fn()
+        return True
+    except OperationalError as e:
+        if get_dialect(conn).is_lock_error(e):
+            return False
+        raise
+
+def run_in_tx_with_retry(conn, fn, max_retries: int, stats=None) -> bool:
+    """Corre fn() en una transacción propia; reintenta con backoff exponencial si MySQL
+       aborta por lock wait timeout o deadlock. Devuelve False si se agotan los intentos."""
+    for attempt in range(max_retries):
+        if try_in_tx(conn, fn):
+            return True
+        if attempt + 1 >= max_retries:
+            break
+        if stats is not None:
+            stats.lock_retries += 1
+        sleep_s = min(2 ** attempt, 8)
+        print(f"⚠️ lock (intento {attempt+1}/{max_retries}). Reintentando en {sleep_s}s...")
+        time.sleep(sleep_s)
+    return False
+
+class AdaptiveBatchSize:
+    """
+    Tamaño de batch (filas por transacción) que se ajusta según cómo responde la BD,
+    que comparte con la API Node:
+      - commits rápidos (< target_s / 2): crece x1.5 hasta max_size
+      - commits lentos (> target_s): baja a la mitad
+      - lock wait / deadlock: baja a la mitad (mínimo min_size)
+    """
+
+    def __init__(self, initial: int, min_size: int = 1, max_size: int = 5000, target_s: float = 0.5):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = min(max(initial, self.min_size), self.max_size)
+        self.target_s = target_s
+
+    def on_commit(self, filas: int, seg: float):
+        if seg > self.target_s:
+            self.size = max(self.min_size, self.size // 2)
+        elif seg < self.target_s / 2 and filas >= self.size:
+            # solo crece si el batch venía lleno (el último de un archivo suele ser más chico)
+            self.size = min(self.max_size, max(self.size + 1, int(self.size * 1.5)))
+
+    def on_contention(self):
+        self.size = max(self.min_size, self.size // 2)
+
+# Espera antes de reintentar un batch partido: 1/4 del backoff de run_in_tx_with_retry
+# (0.25s, 0.5s, 1s, 2s). Cada mitad que vuelve a chocar espera de nuevo, así que con el
+# backoff entero las esperas se sumarían a lo largo del árbol de mitades.
+SPLIT_BACKOFF_FACTOR = 0.25
+
+# Cortes (ms) del histograma de latencia de commit por batch; el último bucket es "> 10000"
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class ImportStats:
+    """
+    Contadores de una corrida, acumulados entre chunks y volcados como JSON al final.
+    insertadas/actualizadas/sin_cambios salen del affected-rows de MySQL por batch: con
+    ON DUPLICATE KEY UPDATE cuenta 1 por fila insertada y 2 por actualizada; la que queda
+    igual cuenta 0, o 1 con CLIENT_FOUND_ROWS, que SQLAlchemy siempre activa en MySQL.
+    Así, actualizadas = afectadas - filas, y el resto se reparte entre insertadas y
+    sin cambios según cuántas claves del batch ya existían antes de escribir.
+    """
+
+    def __init__(self):
+        self.insertadas = 0
+        self.actualizadas = 0
+        self.sin_cambios = 0
+        self.omitidas_por_hash = 0
+        self.batches = 0
+        self.lock_retries = 0
+        self.latencias_ms = []
+
+    def record_batch(self, filas: int, afectadas: int, existentes: int, seg: float):
+        actualizadas = max(0, min(afectadas - filas, filas))
+        insertadas = max(0, min(filas - existentes, filas - actualizadas))
+        self.insertadas += insertadas
+        self.actualizadas += actualizadas
+        self.sin_cambios += filas - actualizadas - insertadas
+        self.batches += 1
+        self.latencias_ms.append(seg * 1000)
+
+    def latency_summary(self) -> dict:
+        if not self.latencias_ms:
+            return {}
+        lat = np.asarray(self.latencias_ms)
+        cuentas = np.bincount(np.searchsorted(LATENCY_BUCKETS_MS, lat), minlength=len(LATENCY_BUCKETS_MS) + 1)
+        etiquetas = [f"<={b}" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        return {
+            "p50": round(float(np.percentile(lat, 50)), 1),
+            "p95": round(float(np.percentile(lat, 95)), 1),
+            "max": round(float(lat.max()), 1),
+            "total": round(float(lat.sum()), 1),
+            "histograma": dict(zip(etiquetas, cuentas.tolist())),
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "insertadas": self.insertadas,
+            "actualizadas": self.actualizadas,
+            "sin_cambios": self.sin_cambios,
+            "omitidas_por_hash": self.omitidas_por_hash,
+            "batches": self.batches,
+            "reintentos_lock": self.lock_retries,
+            "latencia_commit_ms": self.latency_summary(),
+        }
+
+def upsert_rows(df: pd.DataFrame, engine: Engine, batch_size: int = 250, max_retries: int = 5,
+                mode: str = "multirow", table: str = "ComprobantesServicios", skip_unchanged: bool = True,
+                stats: ImportStats = None, controller: AdaptiveBatchSize = None):
     """
     UPSERT masivo con batches. Usa ON DUPLICATE KEY UPDATE.
     Si existe índice UNIQUE por `comprobante`, se evita duplicar por número.
+    Modos:
+      - multirow: un INSERT ... VALUES (...),(...) por transacción, además topeado por bytes
+        según max_allowed_packet.
+      - executemany: filas del batch por transacción vía executemany.
+      - staging: LOAD DATA a una tabla temporal + merge set-based (ver merge_via_staging).
+    Con skip_unchanged, cada fila lleva un hash de contenido (hashContenido) y solo se
+    escriben las nuevas o las que cambiaron respecto de lo guardado.
+    batch_size es el tamaño inicial: AdaptiveBatchSize lo ajusta según la latencia de commit
+    y la contención; un batch que choca con locks se reintenta partido a la mitad. Para que
+    el tamaño aprendido sobreviva entre chunks de un mismo import, pasar el mismo
+    'controller' en cada llamada (si no, se arranca uno nuevo desde batch_size).
+    Devuelve (insertadas, actualizadas) de este DataFrame; si se pasa 'stats', acumula ahí
+    además los sin cambios, latencias y reintentos.
     """
-    from sqlalchemy.exc import OperationalError
-    import time
+    if mode not in WRITE_MODES:
+        raise ValueError(f"Modo de escritura desconocido: {mode} (opciones: {', '.join(WRITE_MODES)})")
 
     # Orden estable pero ya dedupeado por comprobante antes
     df = df.sort_values(by=["tipoComprobante", "fecha", "comprobante"], kind="stable").reset_index(drop=True)
 
-    insert_sql = text("""
-        INSERT INTO ComprobantesServicios
-        (tipoComprobante, comprobante, fecha, fechaImputacion, proveedorId, categoriaId, detalles,
-         total, montoPagado, saldo, estadoFacturacion, personal, fechaVencimiento, fechaRegistro,
-         observaciones, personalAnula, fechaAnula)
-        VALUES
-        (:tipoComprobante, :comprobante, :fecha, :fechaImputacion, :proveedorId, :categoriaId, :detalles,
-         :total, :montoPagado, :saldo, :estadoFacturacion, :personal, :fechaVencimiento, :fechaRegistro,
-         :observaciones, :personalAnula, :fechaAnula)
-        ON DUPLICATE KEY UPDATE
-          fechaImputacion=VALUES(fechaImputacion),
-          proveedorId=VALUES(proveedorId),
-          categoriaId=VALUES(categoriaId),
-          detalles=VALUES(detalles),
-          total=VALUES(total),
-          montoPagado=VALUES(montoPagado),
-          saldo=VALUES(saldo),
-          estadoFacturacion=VALUES(estadoFacturacion),
-          personal=VALUES(personal),
-          fechaVencimiento=VALUES(fechaVencimiento),
-          fechaRegistro=VALUES(fechaRegistro),
-          observaciones=VALUES(observaciones),
-          personalAnula=VALUES(personalAnula),
-          fechaAnula=VALUES(fechaAnula)
-    """)
+    if stats is None:
+        stats = ImportStats()
+    antes = (stats.insertadas, stats.actualizadas)
+
+    # Hash de contenido: se guarda siempre; si la fila no cambió, no se reescribe
+    df["hashContenido"] = compute_row_hashes(df)
+    stored = {}
+    if len(df):
+        with engine.connect() as conn:
+            stored = fetch_stored_hashes(conn, df["comprobante"].unique(), table=table)
+    if skip_unchanged and len(df):
+        df, counts = classify_rows(df, stored)
+        df = df.reset_index(drop=True)
+        stats.omitidas_por_hash += counts["sin_cambios"]
+        print(f"  • nuevas: {counts['nuevas']} | cambiadas: {counts['cambiadas']} | sin cambios: {counts['sin_cambios']}")
+    # existentes[i] = claves ya guardadas entre las filas [0, i): separa insertadas de sin cambios
+    existentes = np.concatenate(([0], np.cumsum(df["comprobante"].isin(stored.keys()).to_numpy())))
+
+    dialect = get_dialect(engine)
+    if mode == "staging":
+        if not dialect.supports_load_data:
+            raise ValueError(f"El modo staging usa LOAD DATA y no está disponible en {dialect.name}")
+        merge_via_staging(df, engine, max_retries=max_retries, table=table, stats=stats, existentes=existentes)
+        return stats.insertadas - antes[0], stats.actualizadas - antes[1]
+
+    insert_sql = text(build_upsert_sql(table, dialect))
 
     total_rows = len(df)
     inserted_or_updated = 0
@@ -460,152 +1262,378 @@ def upsert_rows(df: pd.DataFrame, engine: Engine, batch_size: int = 250, max_ret
     with engine.connect() as conn:
         # set de sesión y COMMIT para no dejar transacción abierta
         try:
-            conn.exec_driver_sql("SET SESSION innodb_lock_wait_timeout = 120")
-            conn.exec_driver_sql("SET SESSION transaction_isolation = 'READ-COMMITTED'")
+            dialect.setup_session(conn)
             conn.commit()
         except Exception:
-            pass
+            conn.rollback()
+
+        # columnas nativas (NaN/NaT -> None) una sola vez; los batches son slices de estas listas
+        cols = columns_to_native(df, df.columns)
+        for c in MONEY_COLS:
+            cols[c] = format_centavos(df[c]).tolist()
+        for c in ("proveedorNombre", "categoriaNombre"):
+            cols[c] = [n or None for n in cols[c]]
 
-        # caches en memoria (nombre -> id). Se llenan una vez y se actualizan cuando insertamos nuevos.
-        prov_by_name = {}
-        cat_by_name  = {}
-
-        def ensure_proveedor_id(tx_conn, nombre: str):
-            if not nombre: return None
-            nombre = nombre.strip()
-            if nombre in prov_by_name:
-                return prov_by_name[nombre]
-            row = tx_conn.execute(text("SELECT id FROM ProveedoresServicios WHERE nombre=:n AND deletedAt IS NULL"), {"n": nombre}).fetchone()
-            if row:
-                prov_by_name[nombre] = int(row[0])
-                return prov_by_name[nombre]
-            res = tx_conn.execute(text("INSERT INTO ProveedoresServicios (nombre) VALUES (:n)"), {"n": nombre})
-            new_id = int(res.lastrowid)
-            prov_by_name[nombre] = new_id
-            return new_id
-
-        def ensure_categoria_id(tx_conn, nombre: str):
-            if not nombre: return None
-            nombre_norm = normalize_categoria_raw(nombre)
-            if not nombre_norm: return None
-            if nombre_norm in cat_by_name:
-                return cat_by_name[nombre_norm]
-            row = tx_conn.execute(text("SELECT id FROM CategoriasServicios WHERE nombre=:n AND deletedAt IS NULL"), {"n": nombre_norm}).fetchone()
-            if row:
-                cat_by_name[nombre_norm] = int(row[0])
-                return cat_by_name[nombre_norm]
-            res = tx_conn.execute(text("INSERT INTO CategoriasServicios (nombre) VALUES (:n)"), {"n": nombre_norm})
-            new_id = int(res.lastrowid)
-            cat_by_name[nombre_norm] = new_id
-            return new_id
-
-        # acumulamos filas crudas (sin IDs) y resolvemos dentro del batch
-        pending = []
-
-        def flush_batch(rows_raw):
+        # IDs de proveedores y categorías: una sola resolución set-based para todo el archivo.
+        # Después de esto los batches no vuelven a tocar las tablas de lookup.
+        # (una vez por categoría: dropna().unique() no recorre las filas si la columna es category,
+        # y devuelve los nombres en orden de aparición, que resolve_lookup_ids respeta)
+        prov_norm = {n: n.strip() for n in df["proveedorNombre"].dropna().unique() if n}
+        cat_norm = {n: normalize_categoria_raw(n) for n in df["categoriaNombre"].dropna().unique() if n}
+        with conn.begin():
+            prov_by_name = resolve_lookup_ids(conn, "ProveedoresServicios", prov_norm.values())
+            cat_by_name = resolve_lookup_ids(conn, "CategoriasServicios", cat_norm.values())
+        prov_ids = {raw: prov_by_name.get(n) for raw, n in prov_norm.items()}
+        cat_ids = {raw: cat_by_name.get(n) for raw, n in cat_norm.items()}
+
+        if mode == "multirow":
+            budget = get_statement_budget(conn)
+            conn.commit()
+            cum_bytes = np.cumsum(estimate_row_bytes(cols))
+            max_rows = dialect.max_params // len(UPSERT_COLS) if dialect.max_params else None
+
+        def write_chunk(start, stop) -> int:
+            """Escribe las filas [start, stop) y devuelve el affected-rows de MySQL."""
+            if mode == "multirow":
+                filas = build_batch_rows(cols, start, stop, prov_ids, cat_ids)
+                flat = tuple(v for fila in filas for v in fila)
+                sql = build_multirow_sql(len(filas), table, placeholder=placeholder, dialect=dialect)
+                return conn.exec_driver_sql(sql, flat).rowcount
+            return conn.execute(insert_sql, build_batch_params(cols, start, stop, prov_ids, cat_ids)).rowcount  # executemany
+
+        def flush_batch(start, stop, attempt=0):
             nonlocal inserted_or_updated
-            for attempt in range(max_retries):
-                try:
-                    with conn.begin():  # una transacción por batch
-                        batch_params = []
-                        for rr in rows_raw:
-                            prov_id = ensure_proveedor_id(conn, rr.get("proveedorNombre"))
-                            cat_id  = ensure_categoria_id(conn, rr.get("categoriaNombre"))
-                            params = {
-                                "tipoComprobante": rr["tipoComprobante"],
-                                "comprobante": rr["comprobante"],
-                                "fecha": rr["fecha"],
-                                "fechaImputacion": rr["fechaImputacion"],
-                                "proveedorId": prov_id,
-                                "categoriaId": cat_id,
-                                "detalles": rr["detalles"],
-                                "total": float(rr["total"] or 0),
-                                "montoPagado": float(rr["montoPagado"] or 0),
-                                "saldo": float(rr["saldo"] or 0),
-                                "estadoFacturacion": rr["estadoFacturacion"],
-                                "personal": rr["personal"],
-                                "fechaVencimiento": rr["fechaVencimiento"],
-                                "fechaRegistro": rr["fechaRegistro"],
-                                "observaciones": rr["observaciones"],
-                                "personalAnula": rr["personalAnula"],
-                                "fechaAnula": rr["fechaAnula"],
-                            }
-                            batch_params.append({k: noneify(v) for k, v in params.items()})
-                        conn.execute(insert_sql, batch_params)  # executemany
-                    inserted_or_updated += len(rows_raw)
-                    return True
-                except OperationalError as e:
-                    if any(code in str(e.orig) for code in ("1205", "1213")):
-                        sleep_s = min(2 ** attempt, 8)
-                        print(f"⚠️ lock (intento {attempt+1}/{max_retries}). Reintentando en {sleep_s}s...")
-                        time.sleep(sleep_s)
-                        continue
-                    raise
-            return False
+            # una transacción por batch
+            afectadas = []
+            t0 = time.perf_counter()
+            if try_in_tx(conn, lambda: afectadas.append(write_chunk(start, stop))):
+                seg = time.perf_counter() - t0
+                controller.on_commit(stop - start, seg)
+                ya = int(existentes[stop] - existentes[start])
+                if not dialect.upsert_counts_updates_twice:
+                    # el motor cuenta 1 por fila: las claves que ya existían se toman como actualizadas
+                    afectadas.append(stop - start + ya)
+                stats.record_batch(stop - start, afectadas[-1], ya, seg)
+                inserted_or_updated += stop - start
+                return True
+            # contención: achicar y reintentar por mitades; la mitad que entra queda commiteada
+            # y solo la que vuelve a chocar se sigue partiendo
+            controller.on_contention()
+            if attempt + 1 >= max_retries:
+                return False
+            stats.lock_retries += 1
+            sleep_s = min(2 ** attempt, 8) * SPLIT_BACKOFF_FACTOR
+            print(f"⚠️ lock en filas {start}-{stop} (intento {attempt+1}/{max_retries}). "
+                  f"Reintentando por mitades en {sleep_s}s (batch → {controller.size})...")
+            time.sleep(sleep_s)
+            if stop - start == 1:
+                return flush_batch(start, stop, attempt + 1)
+            mid = (start + stop) // 2
+            return flush_batch(start, mid, attempt + 1) and flush_batch(mid, stop, attempt + 1)
 
-        for _, r in df.iterrows():
-            # guardamos la fila cruda (con nombres), sin tocar la conexión (evitamos autobegin aquí)
-            pending.append({
-                "tipoComprobante": r["tipoComprobante"],
-                "comprobante": r["comprobante"],
-                "fecha": r["fecha"],
-                "fechaImputacion": r["fechaImputacion"],
-                "proveedorNombre": (r.get("proveedorNombre") or None),
-                "categoriaNombre": (r.get("categoriaNombre") or None),
-                "detalles": r["detalles"],
-                "total": r["total"],
-                "montoPagado": r["montoPagado"],
-                "saldo": r["saldo"],
-                "estadoFacturacion": r["estadoFacturacion"],
-                "personal": r["personal"],
-                "fechaVencimiento": r["fechaVencimiento"],
-                "fechaRegistro": r["fechaRegistro"],
-                "observaciones": r["observaciones"],
-                "personalAnula": r["personalAnula"],
-                "fechaAnula": r["fechaAnula"],
-            })
-
-            if len(pending) >= batch_size:
-                ok = flush_batch(pending)
-                if not ok:
-                    raise RuntimeError("No se pudo completar el batch por contención de locks.")
-                print(f"  • {inserted_or_updated}/{total_rows} filas upsertadas...")
-                pending = []
-
-        if pending:
-            ok = flush_batch(pending)
-            if not ok:
-                raise RuntimeError("No se pudo completar el batch final por contención de locks.")
-            print(f"  • {inserted_or_updated}/{total_rows} filas upsertadas...")
+        placeholder = "?" if conn.dialect.paramstyle == "qmark" else "%s"
+        if controller is None:
+            controller = AdaptiveBatchSize(batch_size)
+        start = 0
+        while start < total_rows:
+            stop = min(start + controller.size, total_rows)
+            if mode == "multirow":
+                stop = min(stop, max_stop_by_bytes(cum_bytes, start, budget))
+                if max_rows:
+                    stop = min(stop, start + max_rows)
+            if not flush_batch(start, stop):
+                raise RuntimeError("No se pudo completar el batch por contención de locks.")
+            start = stop
+            print(f"  • {inserted_or_updated}/{total_rows} filas upsertadas (batch {controller.size})...")
+        if total_rows:
             time.sleep(0.2)
 
-    return inserted_or_updated, 0
+    return stats.insertadas - antes[0], stats.actualizadas - antes[1]
+
+# ========= Merge vía tabla staging (backfills grandes) =========
+STAGING_TABLE = "tmp_comprobantes_staging"
+STAGING_COLS = [c for c in UPSERT_COLS if c not in ("proveedorId", "categoriaId")] + ["proveedorNombre", "categoriaNombre"]
+
+CREATE_STAGING_SQL = f"""
+CREATE TEMPORARY TABLE {STAGING_TABLE} (
+  id BIGINT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
+  tipoComprobante VARCHAR(100) NOT NULL,
+  comprobante VARCHAR(100) NOT NULL,
+  fecha DATE NOT NULL,
+  fechaImputacion DATE NULL,
+  detalles VARCHAR(500) NULL,
+  total DECIMAL(15,2) NULL,
+  montoPagado DECIMAL(15,2) NULL,
+  saldo DECIMAL(15,2) NULL,
+  estadoFacturacion VARCHAR(100) NULL,
+  personal VARCHAR(255) NULL,
+  fechaVencimiento DATE NULL,
+  fechaRegistro DATE NULL,
+  observaciones TEXT NULL,
+  personalAnula VARCHAR(255) NULL,
+  fechaAnula DATE NULL,
+  proveedorNombre VARCHAR(255) NULL,
+  categoriaNombre VARCHAR(255) NULL,
+  hashContenido CHAR(32) NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+def create_db_engine(local_infile: bool = False) -> Engine:
+    """Engine del importador. El modo staging necesita LOAD DATA LOCAL habilitado en el cliente."""
+    if local_infile and make_url(DATABASE_URL).get_backend_name() in ("mysql", "mariadb"):
+        return create_engine(DATABASE_URL, connect_args={"local_infile": True})
+    return create_engine(DATABASE_URL)
+
+def write_staging_tsv(df: pd.DataFrame, path: Path):
+    """Escribe df[STAGING_COLS] en el formato por defecto de LOAD DATA: TAB entre campos,
+       '\\' como escape y '\\N' para NULL. Se arma columna a columna con ops de string."""
+    partes = []
+    for c in STAGING_COLS:
+        serie = df[c]
+        txt = serie.astype(str)
+        if serie.dtype == object or isinstance(serie.dtype, pd.CategoricalDtype):
+            txt = (txt.str.replace("\\", "\\\\", regex=False).str.replace("\t", "\\t", regex=False)
+                      .str.replace("\n", "\\n", regex=False).str.replace("\r", "\\r", regex=False))
+        partes.append(txt.where(serie.notna(), "\\N"))
+    if not partes[0].empty:
+        lineas = partes[0].str.cat(partes[1:], sep="\t")
+        path.write_text("\n".join(lineas.tolist()) + "\n", encoding="utf-8")
+    else:
+        path.write_text("", encoding="utf-8")
+
+def merge_via_staging(df: pd.DataFrame, engine: Engine, chunk_rows: int = 5000, max_retries: int = 5,
+                      table: str = "ComprobantesServicios", stats: ImportStats = None, existentes=None):
+    """
+    Modo para backfills grandes: en vez de upsertear fila a fila contra la tabla viva,
+      1) escribe el DataFrame mapeado a un TSV temporal,
+      2) lo carga con LOAD DATA LOCAL INFILE en una tabla TEMPORARY de la sesión,
+      3) crea proveedores/categorías faltantes con INSERT IGNORE ... SELECT DISTINCT,
+      4) mergea con INSERT ... SELECT ... ON DUPLICATE KEY UPDATE, resolviendo los IDs
+         con JOIN y cortando por rangos de PK de la staging (una transacción por rango).
+    Requiere un engine con local_infile (ver create_db_engine) y local_infile=ON en el server.
+    Las filas de la staging tienen id 1..N en el orden de df, así que 'existentes' (cumsum de
+    claves ya guardadas, ver upsert_rows) sirve igual para contar por rango.
+    """
+    import tempfile
+
+    if stats is None:
+        stats = ImportStats()
+
+    df = df.copy()
+    for c in MONEY_COLS:
+        df[c] = format_centavos(df[c])
+    for c, norm in (("proveedorNombre", lambda n: n.strip()), ("categoriaNombre", normalize_categoria_raw)):
+        df[c] = map_unique(df[c], lambda n, norm=norm: (norm(n) or None) if isinstance(n, str) else None)
+
+    total_rows = len(df)
+    merged = 0
+    merge_sql = (
+        f"INSERT INTO {table} ({', '.join(UPSERT_COLS)}) "
+        f"SELECT {', '.join('p.id' if c == 'proveedorId' else 'c.id' if c == 'categoriaId' else 's.' + c for c in UPSERT_COLS)} "
+        f"FROM {STAGING_TABLE} s "
+        f"LEFT JOIN ProveedoresServicios p ON p.nombre = s.proveedorNombre "
+        f"LEFT JOIN CategoriasServicios c ON c.nombre = s.categoriaNombre "
+        f"WHERE s.id BETWEEN %s AND %s "
+        f"{MySQLDialect().upsert_clause(UPDATE_COLS)}"
+    )
+
+    with tempfile.TemporaryDirectory(prefix="comprobantes_") as tmpdir:
+        tsv = Path(tmpdir) / "staging.tsv"
+        write_staging_tsv(df, tsv)
+
+        with engine.connect() as conn:
+            try:
+                get_dialect(conn).setup_session(conn)
+                conn.commit()
+            except Exception:
+                pass
+
+            with conn.begin():
+                conn.exec_driver_sql(f"DROP TEMPORARY TABLE IF EXISTS {STAGING_TABLE}")
+                conn.exec_driver_sql(CREATE_STAGING_SQL)
+                conn.exec_driver_sql(
+                    f"LOAD DATA LOCAL INFILE %s INTO TABLE {STAGING_TABLE} CHARACTER SET utf8mb4 "
+                    f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                    f"({', '.join(STAGING_COLS)})",
+                    (str(tsv),),
+                )
+            print(f"  • {total_rows} filas cargadas en staging")
+
+            # Lookups faltantes, set-based (la UNIQUE por nombre + collation ci resuelve duplicados)
+            with conn.begin():
+                for lookup, col in (("ProveedoresServicios", "proveedorNombre"), ("CategoriasServicios", "categoriaNombre")):
+                    conn.exec_driver_sql(
+                        f"INSERT IGNORE INTO {lookup} (nombre) "
+                        f"SELECT DISTINCT {col} FROM {STAGING_TABLE} WHERE {col} IS NOT NULL AND {col} <> ''"
+                    )
+
+            id_min, id_max = conn.exec_driver_sql(f"SELECT MIN(id), MAX(id) FROM {STAGING_TABLE}").fetchone()
+            conn.commit()
+            if id_min is not None:
+                for desde in range(int(id_min), int(id_max) + 1, chunk_rows):
+                    hasta = min(desde + chunk_rows - 1, int(id_max))
+                    afectadas = []
+                    t0 = time.perf_counter()
+                    ok = run_in_tx_with_retry(
+                        conn, lambda: afectadas.append(conn.exec_driver_sql(merge_sql, (desde, hasta)).rowcount),
+                        max_retries, stats=stats)
+                    if not ok:
+                        raise RuntimeError("No se pudo completar el merge por contención de locks.")
+                    ya = int(existentes[hasta] - existentes[desde - 1]) if existentes is not None else 0
+                    stats.record_batch(hasta - desde + 1, afectadas[-1], ya, time.perf_counter() - t0)
+                    merged = min(hasta - int(id_min) + 1, total_rows)
+                    print(f"  • {merged}/{total_rows} filas mergeadas...")
+
+            with conn.begin():
+                conn.exec_driver_sql(f"DROP TEMPORARY TABLE IF EXISTS {STAGING_TABLE}")
+
+    return stats.insertadas, stats.actualizadas
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Importa planillas de Comprobantes de Servicios (Dux) a la BD.")
+    parser.add_argument("excel", nargs="+",
+                        help="rutas a .xls/.xlsx exportados, o directorios (se toman sus .xls/.xlsx)")
+    parser.add_argument("--modo", choices=WRITE_MODES, default="multirow",
+                        help="multirow: INSERT multi-fila topeado por max_allowed_packet (default); "
+                             "executemany: executemany por batch; "
+                             "staging: LOAD DATA a tabla temporal + merge set-based (backfills)")
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="filas por transacción al arrancar (después se adapta a la latencia/contención)")
+    parser.add_argument("--chunk-rows", type=int, default=5000,
+                        help="filas del Excel que se leen, mapean y escriben por vez (memoria acotada)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="lee y mapea el próximo chunk en otro thread mientras se escribe el actual")
+    parser.add_argument("--cola", type=int, default=2,
+                        help="chunks mapeados que pueden esperar en cola en modo --pipeline")
+    parser.add_argument("--procesos", type=int, default=None,
+                        help="con varios archivos: procesos que parsean/mapean en paralelo (default: CPUs)")
+    parser.add_argument("--resumen-json", metavar="RUTA",
+                        help="además de imprimirlo, guarda el resumen JSON de la corrida en RUTA")
+    parser.add_argument("--force", action="store_true",
+                        help="importa aunque el ledger indique que este mismo archivo ya se importó OK")
+    parser.add_argument("--reescribir", action="store_true",
+                        help="escribe todas las filas aunque su hash de contenido no haya cambiado")
+    return parser.parse_args(argv)
+
+def fecha_range(dfm: pd.DataFrame) -> list:
+    """[mínima, máxima] de las fechas no nulas de dfm (vacía si no hay)."""
+    if dfm is None:
+        return []
+    fechas = dfm["fecha"].dropna()
+    return [fechas.min(), fechas.max()] if len(fechas) else []
 
 def main():
-    if len(sys.argv) < 2:
-        print("Uso: python importar_comprobantes_servicios.py <ruta_excel.xls|xlsx>")
-        sys.exit(1)
-    excel_path = Path(sys.argv[1])
-    if not excel_path.exists():
-        print(f"❌ No existe el archivo: {excel_path}")
+    args = parse_args()
+    paths = expand_inputs(args.excel)
+    faltantes = [p for p in paths if not p.exists()]
+    if faltantes:
+        print(f"❌ No existe el archivo: {faltantes[0]}")
+        sys.exit(2)
+    if not paths:
+        print(f"❌ No hay .xls/.xlsx en: {', '.join(args.excel)}")
         sys.exit(2)
 
     print(f"🔗 Conectando a {DATABASE_URL}")
-    engine = create_engine(DATABASE_URL)
+    engine = create_db_engine(local_infile=(args.modo == "staging"))
+    # Antes de tocar la BD (schema, ledger): el engine todavía no abrió ninguna conexión
+    dialect = get_dialect(engine)
+    if args.modo == "staging" and not dialect.supports_load_data:
+        print(f"❌ El modo staging usa LOAD DATA y no está disponible en {dialect.name}")
+        sys.exit(2)
 
     print("🧱 Asegurando schema/tablas...")
     ensure_schema(engine)
 
-    print(f"📖 Leyendo Excel: {excel_path.name}")
-    df = load_excel(excel_path)
+    stats = ImportStats()
+    t0 = time.perf_counter()
+    filas = {}
+    fechas = {}
 
-    print("🧰 Mapeando columnas...")
-    dfm = map_dataframe(df)
+    def resumen(resultado, archivos, error=None):
+        # una línea JSON por corrida, también cuando no hubo nada para importar
+        if len(archivos) == 1:
+            archivo = {"archivo": archivos[0][0].name, "sha256": archivos[0][1]}
+        else:
+            archivo = {"archivos": [{"archivo": p.name, "sha256": sha, "filas_leidas": filas.get(p, 0)}
+                                    for p, sha in archivos]}
+        datos = {**archivo, "modo": args.modo, "resultado": resultado, "filas_leidas": sum(filas.values()),
+                 "duracion_s": round(time.perf_counter() - t0, 3), **stats.as_dict()}
+        if error:
+            datos["error"] = error
+        linea = json.dumps(datos, ensure_ascii=False, default=str)
+        print(f"RESUMEN_JSON {linea}")
+        if args.resumen_json:
+            Path(args.resumen_json).write_text(linea + "\n", encoding="utf-8")
+
+    # Ledger: si un archivo (byte a byte) ya se importó OK, no hay nada que hacer con él
+    pendientes = []
+    omitidos = []
+    for path in paths:
+        sha = file_sha256(path)
+        previa = find_successful_import(engine, sha)
+        if previa and not args.force:
+            print(f"⏭️ {path.name}: archivo idéntico ya importado OK el {previa[0]} ({previa[1]}, {previa[2]} filas). "
+                  f"Nada para hacer (usar --force para reimportar).")
+            omitidos.append((path, sha))
+            continue
+        pendientes.append((path, sha))
+    if not pendientes:
+        resumen("OMITIDO", omitidos)
+        return
+
+    # un solo controlador por import: el tamaño de batch aprendido sigue de un chunk al otro
+    controller = AdaptiveBatchSize(args.batch_size)
+    for path, _ in pendientes:
+        filas[path] = 0
+        fechas[path] = []
 
-    print("⬆️ Insertando / Actualizando registros...")
-    ins, upd = upsert_rows(dfm, engine, batch_size=50, max_retries=8)
+    try:
+        if len(pendientes) == 1:
+            # Lectura streaming: cada chunk se mapea y se escribe antes de leer el siguiente
+            # Con --pipeline, leer/mapear corre en un thread aparte mientras MySQL escribe el chunk anterior
+            excel_path = pendientes[0][0]
+            print(f"📖 Leyendo Excel por chunks de {args.chunk_rows} filas: {excel_path.name}"
+                  f"{' (pipeline)' if args.pipeline else ''}")
+            chunks = iter_mapped_chunks(excel_path, chunk_rows=args.chunk_rows)
+            if args.pipeline:
+                chunks = prefetch(chunks, maxsize=args.cola)
+            for i, (leidas, dfm) in enumerate(chunks, start=1):
+                print(f"⬆️ Chunk {i}: {leidas} filas leídas, {len(dfm)} a escribir (modo {args.modo})...")
+                filas[excel_path] += leidas
+                fechas[excel_path].extend(fecha_range(dfm))
+                upsert_rows(dfm, engine, batch_size=args.batch_size, max_retries=8, mode=args.modo,
+                            skip_unchanged=not args.reescribir, stats=stats, controller=controller)
+        else:
+            # Varios archivos: parseo/mapeo en paralelo, dedupe entre todos y una sola escritura
+            print(f"📖 Leyendo {len(pendientes)} archivos en paralelo...")
+            frames = []
+            for path, leidas, dfm in parse_files([p for p, _ in pendientes], chunk_rows=args.chunk_rows,
+                                                 procesos=args.procesos):
+                print(f"  • {path.name}: {leidas} filas leídas, {0 if dfm is None else len(dfm)} mapeadas")
+                filas[path] = leidas
+                fechas[path] = fecha_range(dfm)
+                frames.append(dfm)
+            dfm = dedupe_latest(frames)
+            print(f"⬆️ {len(dfm)} comprobantes únicos a escribir (modo {args.modo})...")
+            upsert_rows(dfm, engine, batch_size=args.batch_size, max_retries=8, mode=args.modo,
+                        skip_unchanged=not args.reescribir, stats=stats, controller=controller)
+    except Exception as e:
+        # si lo que falló fue la conexión, anotar el ERROR también falla: que no tape el original
+        try:
+            for path, sha in pendientes:
+                record_import(engine, path, sha, "ERROR", filas=filas[path], detalle=str(e)[:2000])
+        except Exception as e_ledger:
+            print(f"⚠️ No se pudo registrar el ERROR en {LEDGER_TABLE}: {e_ledger}")
+        resumen("ERROR", pendientes, str(e)[:500])
+        raise
 
-    print(f"✅ Listo. Upserts: {ins}")
+    for path, sha in pendientes:
+        record_import(engine, path, sha, "OK", filas=filas[path],
+                      fecha_desde=min(fechas[path], default=None), fecha_hasta=max(fechas[path], default=None))
+    print(f"✅ Listo. Insertadas: {stats.insertadas} | Actualizadas: {stats.actualizadas} | "
+          f"Sin cambios: {stats.sin_cambios + stats.omitidas_por_hash} | Reintentos por lock: {stats.lock_retries}")
+    resumen("OK", pendientes)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""
+Marcador de versión de schema para los importadores Python (Dux).
+- Cada paso de DDL (crear tablas, índices, columnas) tiene un nombre estable, p.ej.
+  "comprobantes/002_indice_numero", y se registra en ImportadoresSchema al aplicarse.
+- ensure_schema de cada importador llama a run_schema_steps: si no hay pasos pendientes
+  es una sola consulta chica, sin information_schema ni escaneos de tablas.
+- Para forzar que un paso se re-evalúe, borrar su fila de ImportadoresSchema.
+"""
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+from dialectos_db import get_dialect
+
+SCHEMA_TABLE = "ImportadoresSchema"
+
+CREATE_SCHEMA_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} (
+  paso VARCHAR(150) NOT NULL PRIMARY KEY,
+  aplicadoEn DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+def applied_steps(engine: Engine):
+    """Nombres de pasos ya aplicados, o None si la tabla de marcas todavía no existe."""
+    with engine.connect() as conn:
+        try:
+            return {r[0] for r in conn.execute(text(f"SELECT paso FROM {SCHEMA_TABLE}"))}
+        except DBAPIError:
+            conn.rollback()
+            return None
+
+def run_schema_steps(engine: Engine, steps) -> list:
+    """
+    Corre, en orden, los pasos de 'steps' ([(nombre, fn(conn)), ...]) que no estén marcados.
+    Cada paso va en su propia transacción y se marca al terminar, salvo que fn devuelva
+    False (no se pudo aplicar: se reintenta en la próxima corrida). Los pasos deben ser
+    idempotentes: la primera vez corren contra bases que ya pueden tener el cambio hecho.
+    Devuelve los nombres de los pasos que quedaron aplicados en esta llamada.
+    """
+    hechos = applied_steps(engine) or set()
+    pendientes = [(nombre, fn) for nombre, fn in steps if nombre not in hechos]
+    if not pendientes:
+        return []
+
+    dialect = get_dialect(engine)
+    with engine.begin() as conn:
+        for stmt in dialect.ddl(CREATE_SCHEMA_TABLE_SQL):
+            conn.execute(text(stmt))
+
+    aplicados = []
+    for nombre, fn in pendientes:
+        with engine.begin() as conn:
+            if fn(conn) is False:
+                continue
+            conn.execute(text(f"{dialect.insert_ignore(SCHEMA_TABLE)} (paso) VALUES (:p)"), {"p": nombre})
+        aplicados.append(nombre)
+    return aplicados
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests del matching de vendedores (alias_vendedores) contra SQLite (sin MySQL):
+  cd backend/scripts && python -m pytest -q test_alias_vendedores.py
+Lo que decide decidir_alias queda guardado en VendedoresAlias: estos casos fijan los umbrales.
+"""
+
+import shutil
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+import alias_vendedores
+from alias_vendedores import (
+    ALIAS_SCHEMA_STEPS, IndicePersonal, construir_mapa, decidir_alias, firma_personal, mapa_personal,
+    resolver_vendedores,
+)
+from schema_versiones import run_schema_steps
+
+# (id_personal, nombre, apellido_razon_social)
+PERSONAS = [
+    (1, "JUAN", "PEREZ"),
+    (2, "MARIA LAURA", "GOMEZ"),
+    (3, "CARLOS ALBERTO", "DIAZ"),
+    (4, "CARLOS EDUARDO", "DIAZ"),
+    (5, "PABLO", "FERNANDEZ"),
+    (6, "PABLO", "FERNANDES"),
+    (7, "ROCIO", "BENITEZ"),
+]
+
+@pytest.fixture
+def mapa_e_indice():
+    dfp = pd.DataFrame(PERSONAS, columns=["id_personal", "nombre", "apellido_razon_social"])
+    return construir_mapa(dfp), IndicePersonal(PERSONAS)
+
+def decidir(clave, mapa_e_indice):
+    return decidir_alias(clave, *mapa_e_indice)
+
+@pytest.mark.parametrize("clave", ["PEREZ, JUAN", "PEREZ JUAN", "JUAN PEREZ"])
+def test_exacto_y_dado_vuelta(clave, mapa_e_indice):
+    assert decidir(clave, mapa_e_indice) == (1, "exacto", 1.0)
+
+def test_subconjunto_de_un_solo_vendedor(mapa_e_indice):
+    assert decidir("MARIA GOMEZ", mapa_e_indice) == (2, "tokens", 0.6667)
+
+def test_subconjunto_de_varios_vendedores_es_sin_match(mapa_e_indice):
+    # {CARLOS, DIAZ} está en los dos DIAZ; por trigramas empatan (0.6 y 0.6)
+    assert decidir("CARLOS DIAZ", mapa_e_indice) == (None, "sin_match", None)
+
+@pytest.mark.parametrize("clave, esperado", [
+    ("BENITES ROCIO", (7, "trigramas", 0.75)),
+    # el caso límite: un segundo nombre que el vendedor no tiene pasa justo el umbral
+    ("JUAN CARLOS PEREZ", (1, "trigramas", 0.6111)),
+])
+def test_trigramas_sobre_el_umbral(clave, esperado, mapa_e_indice):
+    assert decidir(clave, mapa_e_indice) == esperado
+
+@pytest.mark.parametrize("clave", [
+    "PEREZ JUANA MARIA",  # mejor: PEREZ JUAN con 0.53
+    "JUAN PERALTA",       # mejor: PEREZ JUAN con 0.50
+])
+def test_trigramas_bajo_el_umbral_es_sin_match(clave, mapa_e_indice):
+    assert decidir(clave, mapa_e_indice) == (None, "sin_match", None)
+
+def test_trigramas_dentro_del_margen_es_sin_match(mapa_e_indice):
+    # FERNANDEZ y FERNANDES empatan en 0.82: sobre el umbral, pero sin MARGEN_TRIGRAMAS
+    assert decidir("PABLO FERNANDE", mapa_e_indice) == (None, "sin_match", None)
+
+def test_sin_match_se_reintenta_solo_si_cambia_personal(tmp_path, monkeypatch):
+    monkeypatch.setattr(alias_vendedores, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(alias_vendedores, "_LECTURAS", {})
+    engine = create_engine(f"sqlite:///{tmp_path / 'alias.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE PersonalDux (id_personal INT NOT NULL, nombre VARCHAR(255), "
+                          "apellido_razon_social VARCHAR(255), updatedAt DATETIME NOT NULL, deletedAt DATETIME)"))
+        conn.execute(text("INSERT INTO PersonalDux VALUES (1, 'JUAN', 'PEREZ', '2025-01-01 00:00:00', NULL), "
+                          "(8, 'LUCIA', 'SOSA', '2025-01-01 00:00:00', NULL)"))
+    run_schema_steps(engine, ALIAS_SCHEMA_STEPS)
+
+    def resolver():
+        firma = firma_personal(engine)
+        return resolver_vendedores(engine, pd.Series(["Martinez Lucia"]), mapa_personal(engine, firma), firma)[0]
+
+    assert resolver() is None
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id_personal, metodo FROM VendedoresAlias")).fetchall() == [(None, "sin_match")]
+
+    # mismo COUNT y MAX(updatedAt): la firma no cambia y el sin_match guardado vale, aunque
+    # el mapa (releído sin cache) ya tenga al vendedor
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE PersonalDux SET apellido_razon_social = 'MARTINEZ' WHERE id_personal = 8"))
+    shutil.rmtree(alias_vendedores.CACHE_DIR)
+    alias_vendedores._LECTURAS.clear()
+    assert mapa_personal(engine)["MARTINEZ, LUCIA"] == 8
+    assert resolver() is None
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE PersonalDux SET updatedAt = '2025-02-01 00:00:00' WHERE id_personal = 8"))
+    assert resolver() == 8
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id_personal, metodo FROM VendedoresAlias")).fetchall() == [(8, "exacto")]
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests del importador de comprobantes contra SQLite (sin MySQL):
+  cd backend/scripts && python -m pytest -q test_importar_comprobantes_servicios.py
+"""
+
+from pathlib import Path
+
+from openpyxl import Workbook
+from sqlalchemy import create_engine, text
+
+from importar_comprobantes_servicios import (
+    MAPPED_COLS, SCHEMA_STEPS, dedupe_latest, ensure_schema, iter_mapped_chunks, upsert_rows,
+)
+from schema_versiones import applied_steps, run_schema_steps
+
+ENCABEZADOS = ["Tipo Comprobante", "Comprobante", "Fecha", "Proveedor", "Total"]
+
+def escribir_excel(path, filas):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Comprobantes de Servicios"])  # título arriba del encabezado, como el export de Dux
+    ws.append(ENCABEZADOS)
+    for fila in filas:
+        ws.append(fila)
+    wb.save(path)
+
+def importar(path, db_path, chunk_rows):
+    engine = create_engine(f"sqlite:///{db_path}")
+    ensure_schema(engine)
+    for _, dfm in iter_mapped_chunks(path, chunk_rows=chunk_rows):
+        upsert_rows(dfm, engine, batch_size=50)
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT tipoComprobante, comprobante, fecha, total, hashContenido "
+            "FROM ComprobantesServicios ORDER BY comprobante"
+        )).fetchall()
+
+def test_duplicado_entre_chunks_gana_el_mas_reciente(tmp_path):
+    # el primer chunk se lleva además las filas que se miraron buscando el encabezado
+    relleno = [["FACTURA C", f"C0001-{i:08d}", "10/01/2025", "Aysa", "1.000,00"] for i in range(40)]
+    filas = (
+        [["FACTURA A", "A0001-00000001", "01/01/2025", "Edesur", "100,00"]]
+        + relleno
+        + [["FACTURA B", "A0001-00000001", "05/01/2025", "Edesur", "250,50"],
+           # más vieja y en un chunk posterior: no pisa a la de arriba
+           ["FACTURA A", "C0001-00000003", "02/01/2025", "Aysa", "9,99"]]
+    )
+    path = tmp_path / "gastos.xlsx"
+    escribir_excel(path, filas)
+
+    assert len(list(iter_mapped_chunks(path, chunk_rows=10))) > 2
+    por_chunks = importar(path, tmp_path / "chunks.db", chunk_rows=10)
+    entero = importar(path, tmp_path / "entero.db", chunk_rows=5000)
+
+    assert por_chunks == entero
+    fila = next(r for r in por_chunks if r.comprobante == "A0001-00000001")
+    assert (fila.tipoComprobante, str(fila.fecha), float(fila.total)) == ("FACTURA B", "2025-01-05", 250.5)
+    assert len(por_chunks) == 41
+
+def test_archivo_de_un_chunk_no_cambia(tmp_path):
+    path = tmp_path / "gastos.xlsx"
+    escribir_excel(path, [["FACTURA A", "A0001-00000001", "01/01/2025", "Edesur", "100,00"],
+                          ["FACTURA B", "A0001-00000001", "05/01/2025", "Edesur", "250,50"]])
+    chunks = list(iter_mapped_chunks(path, chunk_rows=5000))
+    assert len(chunks) == 1
+    assert chunks[0][1]["tipoComprobante"].tolist() == ["FACTURA B"]
+
+def test_xls_por_chunks_igual_que_entero(tmp_path):
+    # .xls: los chunks se dedupean en memoria (sin segunda lectura con xlrd)
+    path = Path(__file__).resolve().parent / "descargas" / "temp_gastos_dux.xls"
+    assert len(list(iter_mapped_chunks(path, chunk_rows=100))) > 2
+    assert importar(path, tmp_path / "chunks.db", chunk_rows=100) == importar(path, tmp_path / "entero.db", chunk_rows=5000)
+
+def test_varios_archivos_solo_encabezado(tmp_path):
+    # parse_file devuelve None por cada archivo sin filas
+    df = dedupe_latest([None, None])
+    assert df.empty and list(df.columns) == MAPPED_COLS
+
+def test_unique_por_numero_se_reintenta_hasta_crearse(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dup.db'}")
+    run_schema_steps(engine, SCHEMA_STEPS[:1])  # solo las tablas
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO ComprobantesServicios (tipoComprobante, comprobante, fecha) "
+                          "VALUES ('FACTURA A', 'A0001-00000001', '2025-01-01'), "
+                          "('FACTURA B', 'A0001-00000001', '2025-01-05')"))
+
+    def indices():
+        with engine.connect() as conn:
+            return {r[1] for r in conn.exec_driver_sql("PRAGMA index_list(ComprobantesServicios)")}
+
+    ensure_schema(engine)
+    assert "comprobantes/002_indice_numero" in applied_steps(engine)
+    assert "comprobantes/005_unique_numero" not in applied_steps(engine)
+    assert "idx_comprobantes_numero" in indices() and "uq_comprobantes_numero" not in indices()
+
+    ensure_schema(engine)  # con los duplicados todavía, sigue pendiente
+    assert "comprobantes/005_unique_numero" not in applied_steps(engine)
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM ComprobantesServicios WHERE tipoComprobante = 'FACTURA A'"))
+    ensure_schema(engine)
+    assert "comprobantes/005_unique_numero" in applied_steps(engine)
+    assert "uq_comprobantes_numero" in indices()